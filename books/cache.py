@@ -0,0 +1,66 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+
+LIST_VERSION_KEY = "books:list:version"
+
+
+def _detail_version_key(book_id: int) -> str:
+    return f"books:detail:version:{book_id}"
+
+
+def _get_version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def list_cache_key(request) -> str:
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{params}"
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f"books:list:{_get_version(LIST_VERSION_KEY)}:{digest}"
+
+
+def detail_cache_key(book_id: int) -> str:
+    version = _get_version(_detail_version_key(book_id))
+    return f"books:book:{book_id}:{version}"
+
+
+def _invalidate(book_id: int):
+    _bump_version(LIST_VERSION_KEY)
+    _bump_version(_detail_version_key(book_id))
+
+
+def invalidate_book(book_id: int):
+    """
+    Drop cached list pages and the detail of the book. Runs again after
+    commit so responses cached from pre-commit reads are discarded too.
+    """
+    _invalidate(book_id)
+    transaction.on_commit(lambda: _invalidate(book_id))
+
+
+def _invalidate_many(book_ids):
+    _bump_version(LIST_VERSION_KEY)
+    # A deleted version key is recreated from the clock, past any old value
+    cache.delete_many([_detail_version_key(book_id) for book_id in book_ids])
+
+
+def invalidate_books(book_ids):
+    """Drop cached list pages and the details of many books at once"""
+    book_ids = list(book_ids)
+    _invalidate_many(book_ids)
+    transaction.on_commit(lambda: _invalidate_many(book_ids))
@@ -0,0 +1,200 @@
+import codecs
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+
+from books.cache import invalidate_books
+from books.models import Book
+
+IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+
+STAGING_TABLE = "book_import"
+COVER_TYPES = frozenset(Book.CoverType.values)
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_csv_rows(stream):
+    """Yield (line number, row) pairs from a CSV byte stream with a header"""
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8-sig"))
+    missing = {"title", "author", "inventory", "daily_fee"} - set(
+        reader.fieldnames or ()
+    )
+    if missing:
+        raise ImportFormatError(
+            f"Missing CSV columns: {', '.join(sorted(missing))}"
+        )
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson_rows(stream):
+    """Yield (line number, row) pairs from a newline-delimited JSON stream"""
+    for line_num, line in enumerate(
+        codecs.iterdecode(stream, "utf-8-sig"), start=1
+    ):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else None
+
+
+def import_books(rows) -> dict:
+    """Validate, stage and upsert books matched by (title, author, cover)
+
+    Rows are validated and copied into a temporary table a batch at a
+    time, so memory stays bounded whatever the upload size. The catalog
+    is then upserted with one UPDATE and one INSERT. Invalid rows are
+    skipped and reported.
+    """
+    errors = []
+    error_count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(%s))", [STAGING_TABLE]
+        )
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} ("
+            f"line integer, title varchar(255), author varchar(255), "
+            f"cover varchar(4), inventory integer, "
+            f"daily_fee numeric(10, 2)"
+            f") ON COMMIT DROP"
+        )
+
+        batch = []
+        for line_num, row in rows:
+            values, row_errors = _validate_row(row)
+            if row_errors:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_num, "errors": row_errors})
+                continue
+            batch.append((line_num, *values))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _copy_batch(cursor, batch)
+                batch = []
+        _copy_batch(cursor, batch)
+        cursor.execute(f"ANALYZE {STAGING_TABLE}")
+
+        updated_count, created_count = _upsert_staged_books(cursor)
+        cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+
+    return {
+        "created": created_count,
+        "updated": updated_count,
+        "error_count": error_count,
+        "errors": errors,
+    }
+
+
+def _validate_row(row) -> tuple[tuple | None, dict]:
+    if row is None:
+        return None, {"non_field_errors": ["Invalid row."]}
+
+    errors = {}
+    title = _validate_text(row.get("title"), "title", errors)
+    author = _validate_text(row.get("author"), "author", errors)
+
+    cover = row.get("cover") or Book.CoverType.HARD
+    if cover not in COVER_TYPES:
+        errors["cover"] = [f'"{cover}" is not a valid choice.']
+
+    try:
+        inventory = row.get("inventory")
+        if isinstance(inventory, (bool, float)):
+            raise ValueError
+        inventory = int(inventory)
+    except (TypeError, ValueError):
+        errors["inventory"] = ["A valid integer is required."]
+    else:
+        if inventory < 0:
+            errors["inventory"] = [
+                "Ensure this value is greater than or equal to 0."
+            ]
+
+    try:
+        daily_fee = Decimal(str(row.get("daily_fee")))
+    except InvalidOperation:
+        errors["daily_fee"] = ["A valid number is required."]
+    else:
+        if not daily_fee.is_finite() or daily_fee < 0:
+            errors["daily_fee"] = ["A valid number is required."]
+        elif daily_fee.as_tuple().exponent < -2 or daily_fee >= 10**8:
+            errors["daily_fee"] = [
+                "Ensure that there are no more than 10 digits in total "
+                "and 2 decimal places."
+            ]
+
+    if errors:
+        return None, errors
+    return (title, author, cover, inventory, daily_fee), {}
+
+
+def _validate_text(value, field, errors):
+    value = str(value or "").strip()
+    if not value:
+        errors[field] = ["This field is required."]
+    elif len(value) > 255:
+        errors[field] = ["Ensure this field has no more than 255 characters."]
+    return value
+
+
+def _copy_batch(cursor, batch):
+    if not batch:
+        return
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    cursor.cursor.copy_expert(
+        f"COPY {STAGING_TABLE} (line, {', '.join(IMPORT_FIELDS)}) "
+        f"FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def _upsert_staged_books(cursor) -> tuple[int, int]:
+    table = Book._meta.db_table
+    # The last line wins when a book appears several times in the upload
+    staged = (
+        f"(SELECT DISTINCT ON (title, author, cover) * "
+        f"FROM {STAGING_TABLE} ORDER BY title, author, cover, line DESC) "
+        f"staged"
+    )
+    matches = (
+        "book.title = staged.title AND book.author = staged.author "
+        "AND book.cover = staged.cover"
+    )
+    # Lock in id order like Book.reduce_inventories to avoid deadlocks
+    cursor.execute(
+        f"SELECT book.id FROM {table} book, {staged} WHERE {matches} "
+        f"ORDER BY book.id FOR UPDATE OF book"
+    )
+    cursor.execute(
+        f"UPDATE {table} book "
+        f"SET inventory = staged.inventory, daily_fee = staged.daily_fee, "
+        f"updated_at = statement_timestamp(), version = book.version + 1 "
+        f"FROM {staged} WHERE {matches} RETURNING book.id"
+    )
+    updated_count = 0
+    while rows := cursor.fetchmany(IMPORT_BATCH_SIZE):
+        invalidate_books(book_id for book_id, in rows)
+        updated_count += len(rows)
+    cursor.execute(
+        f"INSERT INTO {table} (title, author, cover, inventory, daily_fee) "
+        f"SELECT title, author, cover, inventory, daily_fee FROM {staged} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table} book WHERE {matches})"
+    )
+    created_count = cursor.rowcount
+    if created_count and not updated_count:
+        invalidate_books([])
+    return updated_count, created_count
@@ -0,0 +1,49 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.importer import import_books, read_csv_rows
+
+
+def _csv_lines(rows):
+    yield b"title,author,cover,inventory,daily_fee\n"
+    for i in range(rows):
+        yield (
+            f"Import book {i},Import author {i % 1000},HARD,3,1.50\n"
+        ).encode()
+
+
+def _max_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a streamed CSV book import and report peak process memory. "
+        "The import is rolled back, but only run it against a development "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        for label in ("insert", "update"):
+            with transaction.atomic():
+                if label == "update":
+                    import_books(read_csv_rows(_csv_lines(rows)))
+
+                start = time.perf_counter()
+                result = import_books(read_csv_rows(_csv_lines(rows)))
+                elapsed = time.perf_counter() - start
+
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{label}: {rows} rows in {elapsed:.2f}s "
+                f"({result['created']} created, {result['updated']} "
+                f"updated), peak RSS {_max_rss_mib():.0f} MiB"
+            )
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from books.models import Book
+
+
+def _borrow_with_row_lock(book_id):
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(pk=book_id)
+        if book.inventory <= 0:
+            raise ValidationError("This book is out of stock")
+        Book.objects.filter(pk=book_id).update(inventory=F("inventory") - 1)
+        book.refresh_from_db()
+
+
+def _borrow_lock_free(book_id):
+    with transaction.atomic():
+        Book(pk=book_id).reduce_inventory()
+
+
+STRATEGIES = {
+    "row-lock": _borrow_with_row_lock,
+    "lock-free": _borrow_lock_free,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure borrow throughput for parallel borrowers of the same book "
+        "with the row-lock and the lock-free inventory decrement"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--borrows", type=int, default=200)
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        borrows = options["borrows"]
+
+        for name, borrow in STRATEGIES.items():
+            book = Book.objects.create(
+                title="Benchmark book",
+                author="Benchmark author",
+                inventory=workers * borrows,
+                daily_fee=0,
+            )
+            try:
+                elapsed = self._run(borrow, book.pk, workers, borrows)
+                book.refresh_from_db()
+            finally:
+                book.delete()
+
+            self.stdout.write(
+                f"{name}: {workers} workers x {borrows} borrows "
+                f"in {elapsed:.2f}s "
+                f"({workers * borrows / elapsed:.0f} borrows/s, "
+                f"inventory left: {book.inventory})"
+            )
+
+    @staticmethod
+    def _run(borrow, book_id, workers, borrows):
+        barrier = threading.Barrier(workers + 1)
+
+        def worker():
+            connection.ensure_connection()
+            barrier.wait()
+            try:
+                for _ in range(borrows):
+                    borrow(book_id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 07:25
+
+import django.db.models.functions.datetime
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The column default is stable, so existing rows are filled without a
+    # table rewrite; the sync index is built concurrently, which requires
+    # running outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("books", "0004_book_book_title_trgm_idx_book_book_author_trgm_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookTombstone",
+            fields=[
+                ("book_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("deleted_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_default=django.db.models.functions.datetime.Now()
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                fields=["updated_at", "id"], name="book_updated_at_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_updated_at_booktombstone"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="version",
+            field=models.IntegerField(db_default=1, default=1),
+        ),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
-from django.db.models import F
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Now
 from rest_framework.exceptions import ValidationError
 
+from books.signals import inventory_changed
+from library_service.conditional import VersionedModel
 
-class Book(models.Model):
+
+class Book(VersionedModel):
     class CoverType(models.TextChoices):
         HARD = "HARD", "Hardcover"
         SOFT = "SOFT", "Softcover"
@@ -15,22 +21,137 @@ class Book(models.Model):
     )
     inventory = models.IntegerField()
     daily_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    search_vector = models.GeneratedField(
+        expression=SearchVector("title", "author", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    # The database default covers raw SQL inserts such as the bulk import
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
     class Meta:
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title", "id"], name="book_title_id_idx"),
+            models.Index(
+                fields=["updated_at", "id"], name="book_updated_at_id_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="book_search_vector_idx"),
+            GinIndex(
+                fields=["title"],
+                name="book_title_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["author"],
+                name="book_author_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self):
         return (f"{self.title} (author: {self.author}, "
                 f"inventory: {self.inventory})")
 
     def reduce_inventory(self):
-        if self.inventory > 0:
-            Book.objects.filter(pk=self.pk).update(
-                inventory=F("inventory") - 1
-            )
-            self.refresh_from_db()
-        else:
+        """Take one copy with a single conditional UPDATE, no row lock"""
+        inventory = self._update_inventory(
+            "inventory - 1", "AND inventory > 0"
+        )
+        if inventory is None:
             raise ValidationError("This book is out of stock")
+        self.inventory = inventory
 
     def increase_inventory(self):
-        Book.objects.filter(pk=self.pk).update(inventory=F("inventory") + 1)
+        """Put one copy back with a single UPDATE"""
+        self.inventory = self._update_inventory("inventory + 1")
+
+    @classmethod
+    def reduce_inventories(cls, book_ids) -> dict[int, int]:
+        """Take one copy of each book, locking the rows in id order
+
+        Locking in a deterministic order keeps concurrent multi-book
+        checkouts from deadlocking on each other. Returns the remaining
+        inventory per book id.
+        """
+        with transaction.atomic():
+            inventories = dict(
+                cls.objects.select_for_update()
+                .filter(id__in=book_ids)
+                .order_by("id")
+                .values_list("id", "inventory")
+            )
+            unavailable = sorted(
+                book_id
+                for book_id in set(book_ids)
+                if inventories.get(book_id, 0) <= 0
+            )
+            if unavailable:
+                raise ValidationError(
+                    "These books are out of stock: "
+                    + ", ".join(str(book_id) for book_id in unavailable)
+                )
+            cls.objects.filter(id__in=book_ids).update(
+                inventory=F("inventory") - 1,
+                updated_at=Now(),
+                version=F("version") + 1,
+            )
+
+        for book_id in inventories:
+            inventory_changed.send(sender=cls, book_id=book_id)
+        return {
+            book_id: inventory - 1
+            for book_id, inventory in inventories.items()
+        }
+
+    @classmethod
+    def increase_inventories(cls, counts: dict[int, int]):
+        """Put copies back to several books, locking the rows in id order"""
+        with transaction.atomic():
+            list(
+                cls.objects.select_for_update()
+                .filter(id__in=counts)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            cls.objects.filter(id__in=counts).update(
+                inventory=F("inventory")
+                + Case(
+                    *(
+                        When(id=book_id, then=count)
+                        for book_id, count in counts.items()
+                    )
+                ),
+                updated_at=Now(),
+                version=F("version") + 1,
+            )
+
+        for book_id in counts:
+            inventory_changed.send(sender=cls, book_id=book_id)
+
+    def _update_inventory(self, expression, condition=""):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self._meta.db_table} "
+                f"SET inventory = {expression}, "
+                f"updated_at = statement_timestamp(), "
+                f"version = version + 1 "
+                f"WHERE id = %s {condition} "
+                f"RETURNING inventory",
+                [self.pk],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        inventory_changed.send(sender=Book, book_id=self.pk)
+        return row[0]
+
+
+class BookTombstone(models.Model):
+    """Marks a deleted book so delta syncs can tell clients to drop it"""
+
+    book_id = models.IntegerField(primary_key=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Book {self.book_id} deleted at {self.deleted_at}"
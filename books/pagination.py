@@ -0,0 +1,20 @@
+from rest_framework.pagination import PageNumberPagination
+
+from library_service.pagination import KeysetCursorPagination
+
+
+class BookCursorPagination(KeysetCursorPagination):
+    """Keyset pagination over the catalog ordered by (title, id)"""
+
+    ordering = ("title", "id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class BookSearchPagination(PageNumberPagination):
+    """Page numbers for rank-ordered search results"""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
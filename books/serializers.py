@@ -1,9 +1,18 @@
 from rest_framework import serializers
 
 from books.models import Book
+from library_service.fieldsets import SparseFieldsetSerializerMixin
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Book
         fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+
+
+class BookAutocompleteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ("id", "title", "author")
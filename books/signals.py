@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from books.cache import invalidate_book
+
+inventory_changed = Signal()
+
+
+@receiver(post_save, sender="books.Book")
+@receiver(post_delete, sender="books.Book")
+def invalidate_book_on_change(sender, instance, **kwargs):
+    invalidate_book(instance.pk)
+
+
+@receiver(post_delete, sender="books.Book")
+def create_book_tombstone(sender, instance, **kwargs):
+    from books.models import BookTombstone
+
+    BookTombstone.objects.create(book_id=instance.pk)
+
+
+@receiver(inventory_changed)
+def invalidate_book_on_inventory_change(sender, book_id, **kwargs):
+    invalidate_book(book_id)
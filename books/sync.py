@@ -0,0 +1,75 @@
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from books.models import Book, BookTombstone
+
+SYNC_PAGE_SIZE = 500
+# Rows are stamped before their transaction commits, so a watermark is
+# never moved past this window and late commits are picked up next time
+SYNC_LAG = datetime.timedelta(minutes=5)
+TOMBSTONE_RETENTION = datetime.timedelta(days=30)
+
+
+def parse_watermark(value: str) -> tuple[datetime.datetime, int]:
+    """Read a watermark or a plain ISO 8601 timestamp, or raise ValueError"""
+    timestamp, _, book_id = value.partition(",")
+    changed_since = parse_datetime(timestamp.strip())
+    if changed_since is None:
+        raise ValueError(value)
+    if timezone.is_naive(changed_since):
+        changed_since = timezone.make_aware(changed_since)
+    return changed_since, int(book_id or 0)
+
+
+def format_watermark(changed_since: datetime.datetime, book_id: int) -> str:
+    timestamp = changed_since.astimezone(datetime.timezone.utc).isoformat()
+    return f"{timestamp.replace('+00:00', 'Z')},{book_id}"
+
+
+def get_changes(changed_since: datetime.datetime | None, after_id: int = 0):
+    """Return a page of books changed after a watermark and deleted ids
+
+    Books come in (updated_at, id) order so a page can end anywhere, even
+    among rows stamped by the same bulk update. The returned watermark
+    points past the page while there is more, and otherwise lags behind
+    the clock by SYNC_LAG. Without a watermark the whole catalog is paged
+    and no deletions are reported.
+    """
+    now = timezone.now()
+    books = Book.objects.order_by("updated_at", "id")
+    if changed_since is not None:
+        books = books.filter(updated_at__gte=changed_since).filter(
+            Q(updated_at__gt=changed_since) | Q(id__gt=after_id)
+        )
+    books = list(books[: SYNC_PAGE_SIZE + 1])
+    has_more = len(books) > SYNC_PAGE_SIZE
+    books = books[:SYNC_PAGE_SIZE]
+
+    deleted = []
+    if changed_since is not None:
+        deleted = list(
+            BookTombstone.objects.filter(deleted_at__gt=changed_since)
+            .order_by("deleted_at")
+            .values_list("book_id", flat=True)
+        )
+
+    if has_more:
+        watermark = format_watermark(books[-1].updated_at, books[-1].id)
+    else:
+        watermark = format_watermark(now - SYNC_LAG, 0)
+    return {
+        "books": books,
+        "deleted": deleted,
+        "watermark": watermark,
+        "has_more": has_more,
+    }
+
+
+def purge_book_tombstones():
+    """django-q task deleting tombstones older than TOMBSTONE_RETENTION"""
+    BookTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION
+    ).delete()
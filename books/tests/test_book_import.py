@@ -0,0 +1,131 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from books.models import Book
+
+BOOKS_URL = reverse("books:book-list")
+BOOKS_IMPORT_URL = reverse("books:book-bulk-import")
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+class BookImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.test_admin = get_user_model().objects.create(
+            email="admin@test.com", password="1qazcde3", is_staff=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_admin)
+
+    def post_csv(self, content):
+        return self.client.post(
+            BOOKS_IMPORT_URL, content, content_type="text/csv"
+        )
+
+    def test_import_csv(self):
+        response = self.post_csv(
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Frank Herbert,SOFT,3,1.50\n"
+            '"War, and Peace",Leo Tolstoy,,2,0.75\n'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["errors"], [])
+        book = Book.objects.get(title="War, and Peace")
+        self.assertEqual(book.cover, Book.CoverType.HARD)
+        self.assertEqual(book.inventory, 2)
+
+    def test_import_ndjson(self):
+        rows = [
+            {"title": "Dune", "author": "Frank Herbert", "inventory": 3,
+             "daily_fee": "1.50"},
+            {"title": "Emma", "author": "Jane Austen", "inventory": 1,
+             "daily_fee": 1},
+        ]
+        response = self.client.post(
+            BOOKS_IMPORT_URL,
+            "\n".join(json.dumps(row) for row in rows),
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_import_updates_existing_books(self):
+        book = Book.objects.create(
+            title="Dune", author="Frank Herbert", inventory=1, daily_fee=1
+        )
+        self.client.get(BOOKS_URL)
+
+        response = self.post_csv(
+            "title,author,inventory,daily_fee\n"
+            "Dune,Frank Herbert,4,2.00\n"
+            "Dune,Frank Herbert,5,2.00\n"
+        )
+        book.refresh_from_db()
+        list_response = self.client.get(BOOKS_URL)
+
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual(response.data["created"], 0)
+        self.assertEqual(book.inventory, 5)
+        self.assertEqual(list_response.data["results"][0]["inventory"], 5)
+
+    def test_invalid_rows_reported(self):
+        response = self.post_csv(
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Frank Herbert,HARD,3,1.50\n"
+            ",Nobody,HARD,1,1\n"
+            "Emma,Jane Austen,PAPER,-1,0.001\n"
+        )
+
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["error_count"], 2)
+        self.assertEqual(
+            response.data["errors"][0],
+            {"line": 3, "errors": {"title": ["This field is required."]}},
+        )
+        self.assertEqual(
+            set(response.data["errors"][1]["errors"]),
+            {"cover", "inventory", "daily_fee"},
+        )
+
+    def test_missing_csv_columns_rejected(self):
+        response = self.post_csv("title,author\nDune,Frank Herbert\n")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Book.objects.exists())
+
+    def test_unsupported_content_type_rejected(self):
+        response = self.client.post(
+            BOOKS_IMPORT_URL, {"title": "Dune"}, format="json"
+        )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    def test_import_forbidden_for_user(self):
+        self.client.force_authenticate(user=self.test_user)
+        response = self.post_csv("title,author,inventory,daily_fee\n")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
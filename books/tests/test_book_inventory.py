@@ -0,0 +1,79 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.exceptions import ValidationError
+
+from books.models import Book
+
+
+def book_sample(**params):
+    defaults = {
+        "title": "Sample book",
+        "author": "Sample author",
+        "inventory": 10,
+        "daily_fee": 0.50,
+    }
+    defaults.update(params)
+    return Book.objects.create(**defaults)
+
+
+class BookInventoryTests(TestCase):
+    def test_reduce_inventory(self):
+        book = book_sample(inventory=2)
+
+        with self.assertNumQueries(1):
+            book.reduce_inventory()
+
+        self.assertEqual(book.inventory, 1)
+        self.assertEqual(Book.objects.get(pk=book.pk).inventory, 1)
+
+    def test_reduce_inventory_out_of_stock(self):
+        book = book_sample(inventory=0)
+
+        with self.assertRaises(ValidationError):
+            book.reduce_inventory()
+
+        self.assertEqual(Book.objects.get(pk=book.pk).inventory, 0)
+
+    def test_reduce_inventory_ignores_stale_instance(self):
+        book = book_sample(inventory=1)
+        stale_book = Book.objects.get(pk=book.pk)
+        book.reduce_inventory()
+
+        with self.assertRaises(ValidationError):
+            stale_book.reduce_inventory()
+
+    def test_increase_inventory(self):
+        book = book_sample(inventory=0)
+
+        with self.assertNumQueries(1):
+            book.increase_inventory()
+
+        self.assertEqual(book.inventory, 1)
+        self.assertEqual(Book.objects.get(pk=book.pk).inventory, 1)
+
+
+class BookInventoryConcurrencyTests(TransactionTestCase):
+    def test_parallel_borrowers_never_oversell(self):
+        book = book_sample(inventory=5)
+        borrowed = []
+
+        def borrow():
+            try:
+                Book.objects.get(pk=book.pk).reduce_inventory()
+                borrowed.append(book.pk)
+            except ValidationError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        book.refresh_from_db()
+
+        self.assertEqual(len(borrowed), 5)
+        self.assertEqual(book.inventory, 0)
@@ -0,0 +1,157 @@
+import datetime
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from books.importer import import_books
+from books.models import Book, BookTombstone
+from books.sync import SYNC_LAG, format_watermark
+
+BOOKS_SYNC_URL = reverse("books:book-sync")
+
+
+def create_book(**params):
+    defaults = {
+        "title": "Sample book",
+        "author": "Sample author",
+        "inventory": 10,
+        "daily_fee": 0.50,
+    }
+    defaults.update(params)
+
+    return Book.objects.create(**defaults)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+class BookSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.book_1 = create_book(title="Book_1")
+        cls.book_2 = create_book(title="Book_2")
+        cls.book_3 = create_book(title="Book_3")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+        self.past = timezone.now() - datetime.timedelta(days=1)
+        Book.objects.update(updated_at=self.past)
+        self.since = format_watermark(
+            self.past + datetime.timedelta(seconds=1), 0
+        )
+
+    def sync(self, changed_since):
+        return self.client.get(
+            BOOKS_SYNC_URL, {"changed_since": changed_since}
+        )
+
+    def test_sync_returns_only_changed_books(self):
+        book = Book.objects.get(id=self.book_2.id)
+        book.title = "Updated title"
+        book.save()
+
+        response = self.sync(self.since)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["title"] for item in response.data["books"]],
+            ["Updated title"],
+        )
+        self.assertEqual(response.data["deleted"], [])
+        self.assertFalse(response.data["has_more"])
+
+    def test_sync_watermark_lags_behind_clock(self):
+        before = timezone.now()
+
+        response = self.sync(self.since)
+        timestamp = response.data["watermark"].partition(",")[0]
+
+        self.assertLessEqual(
+            datetime.datetime.fromisoformat(timestamp),
+            before - SYNC_LAG + datetime.timedelta(seconds=1),
+        )
+
+    def test_inventory_changes_bump_updated_at(self):
+        Book.objects.get(id=self.book_1.id).reduce_inventory()
+        Book.reduce_inventories([self.book_2.id])
+        Book.increase_inventories({self.book_3.id: 1})
+
+        response = self.sync(self.since)
+
+        self.assertEqual(
+            sorted(item["id"] for item in response.data["books"]),
+            [self.book_1.id, self.book_2.id, self.book_3.id],
+        )
+
+    def test_import_update_bumps_updated_at(self):
+        import_books(
+            iter([(2, {"title": "Book_1", "author": "Sample author",
+                       "inventory": 4, "daily_fee": "0.50"})])
+        )
+
+        response = self.sync(self.since)
+
+        self.assertEqual(
+            [item["id"] for item in response.data["books"]], [self.book_1.id]
+        )
+        self.assertEqual(response.data["books"][0]["inventory"], 4)
+
+    def test_sync_reports_deleted_books(self):
+        book_id = self.book_3.id
+        Book.objects.filter(id=book_id).delete()
+
+        response = self.sync(self.since)
+
+        self.assertTrue(BookTombstone.objects.filter(book_id=book_id).exists())
+        self.assertEqual(response.data["deleted"], [book_id])
+
+    @patch("books.sync.SYNC_PAGE_SIZE", 2)
+    def test_sync_pages_through_books_with_same_timestamp(self):
+        watermark = format_watermark(
+            self.past - datetime.timedelta(seconds=1), 0
+        )
+        pages = []
+        while True:
+            response = self.sync(watermark)
+            pages.append([item["id"] for item in response.data["books"]])
+            watermark = response.data["watermark"]
+            if not response.data["has_more"]:
+                break
+
+        self.assertEqual(
+            pages,
+            [[self.book_1.id, self.book_2.id], [self.book_3.id]],
+        )
+
+    def test_sync_without_watermark_returns_catalog(self):
+        response = self.client.get(BOOKS_SYNC_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["books"]), 3)
+
+    def test_sync_invalid_watermark(self):
+        response = self.sync("yesterday")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_watermark_older_than_tombstones(self):
+        response = self.sync(
+            format_watermark(
+                timezone.now() - datetime.timedelta(days=365), 0
+            )
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
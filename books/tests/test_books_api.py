@@ -1,5 +1,12 @@
+import csv
+import io
+import json
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
@@ -8,6 +15,9 @@ from books.models import Book
 from books.serializers import BookSerializer
 
 BOOKS_URL = reverse("books:book-list")
+BOOKS_SEARCH_URL = reverse("books:book-search")
+BOOKS_AUTOCOMPLETE_URL = reverse("books:book-autocomplete")
+BOOKS_EXPORT_URL = reverse("books:book-export")
 
 
 def get_detail_url(book_id):
@@ -26,6 +36,13 @@ def create_book(**params):
     return Book.objects.create(**defaults)
 
 
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
 class BooksAPITestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -43,6 +60,9 @@ class BooksAPITestCase(TestCase):
                 daily_fee=0.50,
             )
 
+    def setUp(self):
+        cache.clear()
+
 
 class UnauthorizedUserTests(BooksAPITestCase):
     def test_books_list(self):
@@ -51,7 +71,7 @@ class UnauthorizedUserTests(BooksAPITestCase):
         serializer = BookSerializer(books, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_books_detail(self):
         book = Book.objects.first()
@@ -93,6 +113,7 @@ class UnauthorizedUserTests(BooksAPITestCase):
 
 class AuthorizedUserTests(BooksAPITestCase):
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.client.force_authenticate(user=self.test_user)
 
@@ -102,7 +123,7 @@ class AuthorizedUserTests(BooksAPITestCase):
         serializer = BookSerializer(books, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_books_detail(self):
         book = Book.objects.first()
@@ -144,6 +165,7 @@ class AuthorizedUserTests(BooksAPITestCase):
 
 class AdminUserTests(BooksAPITestCase):
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.client.force_authenticate(user=self.test_admin)
 
@@ -153,7 +175,7 @@ class AdminUserTests(BooksAPITestCase):
         serializer = BookSerializer(books, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_books_detail(self):
         book = Book.objects.first()
@@ -197,3 +219,384 @@ class AdminUserTests(BooksAPITestCase):
         response = self.client.delete(get_detail_url(book.id))
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class BookPaginationTests(BooksAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+
+    def test_books_list_follows_cursor(self):
+        response = self.client.get(BOOKS_URL, {"page_size": 2})
+        titles = [book["title"] for book in response.data["results"]]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(titles, ["Book_0", "Book_1"])
+        self.assertIsNone(response.data["previous"])
+
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            titles += [book["title"] for book in response.data["results"]]
+
+        self.assertEqual(
+            titles, list(Book.objects.values_list("title", flat=True))
+        )
+
+    def test_books_list_same_title_ordered_by_id(self):
+        duplicates = [create_book(title="Book_0") for _ in range(3)]
+        response = self.client.get(BOOKS_URL, {"page_size": 2})
+        ids = [book["id"] for book in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        ids += [book["id"] for book in response.data["results"]]
+        expected_ids = list(
+            Book.objects.filter(title="Book_0")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+        self.assertEqual(ids, expected_ids)
+        self.assertEqual(len(ids), len(duplicates) + 1)
+
+    def test_books_list_pages_through_large_title_tie(self):
+        Book.objects.bulk_create(
+            Book(title="Book_2", author="Author", inventory=1, daily_fee=1)
+            for _ in range(1100)
+        )
+        expected_ids = list(
+            Book.objects.order_by("title", "id").values_list("id", flat=True)
+        )
+        response = self.client.get(BOOKS_URL, {"page_size": 100})
+        ids = [book["id"] for book in response.data["results"]]
+        # Bounded, since a cursor stuck inside the tie never runs out
+        while response.data["next"] and len(ids) <= len(expected_ids):
+            response = self.client.get(response.data["next"])
+            ids += [book["id"] for book in response.data["results"]]
+
+        self.assertEqual(ids, expected_ids)
+
+    def test_books_list_follows_previous_cursor(self):
+        response = self.client.get(BOOKS_URL, {"page_size": 2})
+        first_page = response.data["results"]
+        response = self.client.get(response.data["next"])
+        response = self.client.get(response.data["previous"])
+
+        self.assertEqual(response.data["results"], first_page)
+        self.assertIsNone(response.data["previous"])
+
+    def test_books_list_invalid_cursor(self):
+        response = self.client.get(BOOKS_URL, {"cursor": "garbage"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_books_list_page_size_capped(self):
+        for i in range(5, 105):
+            create_book(title=f"Book_{i}")
+        response = self.client.get(BOOKS_URL, {"page_size": 1000})
+
+        self.assertEqual(len(response.data["results"]), 100)
+
+
+class BookSearchTests(BooksAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+        self.hobbit = create_book(title="The Hobbit", author="J. R. R. Tolkien")
+        self.silmarillion = create_book(
+            title="The Silmarillion", author="J. R. R. Tolkien"
+        )
+        self.dune = create_book(title="Dune", author="Frank Herbert")
+
+    def test_search_by_title(self):
+        response = self.client.get(BOOKS_SEARCH_URL, {"q": "hobbit"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(
+            response.data["results"], [BookSerializer(self.hobbit).data]
+        )
+
+    def test_search_by_author(self):
+        response = self.client.get(BOOKS_SEARCH_URL, {"q": "tolkien"})
+        ids = {book["id"] for book in response.data["results"]}
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, {self.hobbit.id, self.silmarillion.id})
+
+    def test_search_ranks_better_matches_first(self):
+        response = self.client.get(
+            BOOKS_SEARCH_URL, {"q": "silmarillion or tolkien"}
+        )
+        ids = [book["id"] for book in response.data["results"]]
+
+        self.assertEqual(ids, [self.silmarillion.id, self.hobbit.id])
+
+    def test_search_without_query(self):
+        response = self.client.get(BOOKS_SEARCH_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookAutocompleteTests(BooksAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+        self.hobbit = create_book(
+            title="The Hobbit", author="J. R. R. Tolkien"
+        )
+        self.dune = create_book(title="Dune", author="Frank Herbert")
+
+    def test_autocomplete_by_title_fragment(self):
+        response = self.client.get(BOOKS_AUTOCOMPLETE_URL, {"q": "hobb"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "id": self.hobbit.id,
+                    "title": self.hobbit.title,
+                    "author": self.hobbit.author,
+                }
+            ],
+        )
+
+    def test_autocomplete_by_misspelled_title(self):
+        response = self.client.get(BOOKS_AUTOCOMPLETE_URL, {"q": "hobit"})
+        ids = [book["id"] for book in response.data]
+
+        self.assertEqual(ids, [self.hobbit.id])
+
+    def test_autocomplete_by_author(self):
+        response = self.client.get(BOOKS_AUTOCOMPLETE_URL, {"q": "herbert"})
+        ids = [book["id"] for book in response.data]
+
+        self.assertEqual(ids, [self.dune.id])
+
+    def test_autocomplete_limit(self):
+        response = self.client.get(
+            BOOKS_AUTOCOMPLETE_URL, {"q": "book", "limit": 2}
+        )
+
+        self.assertEqual(len(response.data), 2)
+
+    def test_autocomplete_without_query(self):
+        response = self.client.get(BOOKS_AUTOCOMPLETE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_uses_trigram_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(BOOKS_AUTOCOMPLETE_URL, {"q": "hobb"})
+
+        # A handful of rows is always cheaper to scan, so rule that out
+        # to see whether the filter can be answered by the indexes at all
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {queries[-1]['sql']}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn("book_title_trgm_idx", plan)
+        self.assertIn("book_author_trgm_idx", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+
+class BookCacheTests(BooksAPITestCase):
+    def test_books_list_served_from_cache(self):
+        self.client.get(BOOKS_URL)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOKS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_books_list_cached_per_query_params(self):
+        self.client.get(BOOKS_URL, {"page_size": 2})
+        response = self.client.get(BOOKS_URL, {"page_size": 3})
+
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_books_detail_served_from_cache(self):
+        book = Book.objects.first()
+        self.client.get(get_detail_url(book.id))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(get_detail_url(book.id))
+
+        self.assertEqual(response.data, BookSerializer(book).data)
+
+    def test_cache_invalidated_on_book_save(self):
+        book = Book.objects.first()
+        self.client.get(BOOKS_URL)
+        self.client.get(get_detail_url(book.id))
+        book.title = "Updated title"
+        book.save()
+
+        list_response = self.client.get(BOOKS_URL)
+        detail_response = self.client.get(get_detail_url(book.id))
+
+        self.assertIn(
+            "Updated title",
+            [item["title"] for item in list_response.data["results"]],
+        )
+        self.assertEqual(detail_response.data["title"], "Updated title")
+
+    def test_cache_invalidated_on_inventory_change(self):
+        book = Book.objects.first()
+        self.client.get(get_detail_url(book.id))
+        book.reduce_inventory()
+
+        response = self.client.get(get_detail_url(book.id))
+
+        self.assertEqual(response.data["inventory"], 9)
+
+        book.increase_inventory()
+        response = self.client.get(get_detail_url(book.id))
+
+        self.assertEqual(response.data["inventory"], 10)
+
+    def test_cache_invalidated_on_book_delete(self):
+        book = Book.objects.first()
+        self.client.get(get_detail_url(book.id))
+        book.delete()
+
+        response = self.client.get(get_detail_url(book.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookExportTests(BooksAPITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_admin)
+
+    def test_books_export_csv(self):
+        response = self.client.get(BOOKS_EXPORT_URL)
+        rows = list(
+            csv.DictReader(
+                io.StringIO(b"".join(response.streaming_content).decode())
+            )
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="books.csv"', response["Content-Disposition"])
+        self.assertEqual(
+            [row["id"] for row in rows],
+            [str(book.id) for book in Book.objects.order_by("id")],
+        )
+        self.assertEqual(rows[0]["daily_fee"], "0.50")
+
+    def test_books_export_ndjson(self):
+        response = self.client.get(BOOKS_EXPORT_URL, {"format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        book = Book.objects.order_by("id").first()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            rows[0],
+            {
+                "id": book.id,
+                "title": book.title,
+                "author": book.author,
+                "cover": book.cover,
+                "inventory": 10,
+                "daily_fee": "0.50",
+            },
+        )
+
+    def test_books_export_admin_only(self):
+        self.client.force_authenticate(user=self.test_user)
+
+        response = self.client.get(BOOKS_EXPORT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookConditionalGetTests(BooksAPITestCase):
+    def test_books_detail_not_modified(self):
+        book = Book.objects.first()
+        response = self.client.get(get_detail_url(book.id))
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                get_detail_url(book.id), HTTP_IF_NONE_MATCH=etag
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_books_detail_modified_after_inventory_change(self):
+        book = Book.objects.first()
+        etag = self.client.get(get_detail_url(book.id))["ETag"]
+        book.reduce_inventory()
+
+        response = self.client.get(
+            get_detail_url(book.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["inventory"], 9)
+
+    def test_books_detail_not_modified_since(self):
+        book = Book.objects.first()
+        last_modified = self.client.get(get_detail_url(book.id))[
+            "Last-Modified"
+        ]
+
+        response = self.client.get(
+            get_detail_url(book.id), HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_book_version_bumped_on_save(self):
+        book = Book.objects.first()
+        book.title = "Updated title"
+        book.save()
+        Book.increase_inventories({book.id: 1})
+        book.refresh_from_db()
+
+        self.assertEqual(book.version, 3)
+
+
+class BookSparseFieldsetTests(BooksAPITestCase):
+    def test_books_list_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(BOOKS_URL, {"fields": "id,inventory"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data["results"][0]), {"id", "inventory"}
+        )
+        self.assertNotIn("author", queries[0]["sql"])
+        self.assertNotIn("search_vector", queries[0]["sql"])
+
+    def test_books_detail_sparse_fields(self):
+        book = Book.objects.first()
+        full = self.client.get(get_detail_url(book.id))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                get_detail_url(book.id), {"fields": "title,daily_fee"}
+            )
+
+        self.assertEqual(
+            response.data, {"title": book.title, "daily_fee": "0.50"}
+        )
+        self.assertNotEqual(response["ETag"], full["ETag"])
+
+    def test_books_list_unknown_field(self):
+        response = self.client.get(BOOKS_URL, {"fields": "id,isbn"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
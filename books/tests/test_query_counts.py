@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.reverse import reverse
+
+from books.models import Book
+
+BOOKS_URL = reverse("books:book-list")
+
+LIST_QUERY_BUDGET = 1
+DETAIL_QUERY_BUDGET = 1
+
+
+def get_detail_url(book_id):
+    return reverse("books:book-detail", args=[book_id])
+
+
+def seed_books(count):
+    Book.objects.bulk_create(
+        Book(
+            title=f"Seed book {i}",
+            author=f"Seed author {i}",
+            inventory=10,
+            daily_fee=0.50,
+        )
+        for i in range(count)
+    )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+class BookQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_list_query_count_independent_of_size(self):
+        for count in (2, 200):
+            seed_books(count)
+            cache.clear()
+            with self.assertNumQueries(LIST_QUERY_BUDGET):
+                self.client.get(BOOKS_URL, {"page_size": 100})
+
+    def test_detail_query_count(self):
+        seed_books(1)
+        book = Book.objects.first()
+
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            self.client.get(get_detail_url(book.id))
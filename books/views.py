@@ -1,11 +1,314 @@
-from rest_framework import viewsets
+import csv
 
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from books.cache import detail_cache_key, list_cache_key
+from books.importer import (
+    ImportFormatError,
+    import_books,
+    read_csv_rows,
+    read_ndjson_rows,
+)
 from books.models import Book
+from books.pagination import BookCursorPagination, BookSearchPagination
 from books.permissions import IsAdminAllOrReadOnly
-from books.serializers import BookSerializer
+from books.serializers import BookSerializer, BookAutocompleteSerializer
+from books.sync import TOMBSTONE_RETENTION, get_changes, parse_watermark
+from library_service.conditional import (
+    conditional_response,
+    make_etag,
+    set_validators,
+)
+from library_service.exports import EXPORT_RENDERERS, stream_export
+from library_service.fieldsets import (
+    SPARSE_FIELDSET_PARAMETERS,
+    SparseFieldsetViewMixin,
+)
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+EXPORT_FIELDS = ("id", "title", "author", "cover", "inventory", "daily_fee")
 
+IMPORT_READERS = {
+    "text/csv": read_csv_rows,
+    "application/x-ndjson": read_ndjson_rows,
+    "application/jsonl": read_ndjson_rows,
+}
 
-class BookViewSet(viewsets.ModelViewSet):
+
+class BookViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminAllOrReadOnly,)
+    pagination_class = BookCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            # Leave out the search vector and fields the client skipped
+            columns = set(BookSerializer.Meta.fields)
+            if self.requested_fields is not None:
+                columns &= self.requested_fields
+            queryset = queryset.only("id", "title", *columns)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "autocomplete":
+            return BookAutocompleteSerializer
+        return BookSerializer
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        """Get cached page of books"""
+        key = list_cache_key(request)
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, settings.BOOK_CACHE_TIMEOUT)
+        return Response(data)
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        """Get cached book detail, or 304 if the client copy is current"""
+        try:
+            book_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        key = detail_cache_key(book_id)
+        entry = cache.get(key)
+        if entry is None:
+            book = self.get_object()
+            entry = {
+                "etag": make_etag(book.id, book.version),
+                "last_modified": book.updated_at,
+                "data": self.get_serializer(book, fields=None).data,
+            }
+            cache.set(key, entry, settings.BOOK_CACHE_TIMEOUT)
+
+        # The whole book is cached and a requested fieldset cut out of it
+        fields = list(self.get_serializer().fields)
+        etag = entry["etag"]
+        if self.requested_fields is not None:
+            etag = make_etag(etag, *fields)
+
+        response = conditional_response(
+            request, etag, entry["last_modified"]
+        )
+        if response is None:
+            response = set_validators(
+                Response({name: entry["data"][name] for name in fields}),
+                etag,
+                entry["last_modified"],
+            )
+        return response
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Full-text search over book title and author",
+                type=OpenApiTypes.STR,
+                required=True,
+            ),
+        ]
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="search",
+        pagination_class=BookSearchPagination,
+    )
+    def search(self, request):
+        """Search books by title and author ordered by relevance"""
+        query = request.query_params.get("q")
+
+        if not query:
+            return Response(
+                {"error": "Missing q"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        search_query = SearchQuery(
+            query, config="english", search_type="websearch"
+        )
+        books = (
+            Book.objects.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .order_by("-rank", "id")
+        )
+        page = self.paginate_queryset(books)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Prefix or fragment of a book title or author",
+                type=OpenApiTypes.STR,
+                required=True,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description=(
+                    f"Number of suggestions "
+                    f"(max {AUTOCOMPLETE_MAX_LIMIT})"
+                ),
+                type=OpenApiTypes.INT,
+                required=False,
+            ),
+        ]
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="autocomplete",
+        pagination_class=None,
+    )
+    def autocomplete(self, request):
+        """Suggest books whose title or author resembles the fragment"""
+        query = request.query_params.get("q", "").strip()
+
+        if not query:
+            return Response(
+                {"error": "Missing q"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            limit = int(
+                request.query_params.get("limit", AUTOCOMPLETE_DEFAULT_LIMIT)
+            )
+        except ValueError:
+            return Response(
+                {"error": "limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), AUTOCOMPLETE_MAX_LIMIT)
+
+        books = (
+            Book.objects.filter(
+                Q(title__trigram_word_similar=query)
+                | Q(author__trigram_word_similar=query)
+            )
+            .annotate(
+                similarity=Greatest(
+                    TrigramWordSimilarity(query, "title"),
+                    TrigramWordSimilarity(query, "author"),
+                )
+            )
+            .order_by("-similarity", "title", "id")
+            .only("id", "title", "author")[:limit]
+        )
+        serializer = self.get_serializer(books, many=True)
+        return Response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="changed_since",
+                description=(
+                    "Watermark from the previous sync or an ISO 8601 "
+                    "timestamp; omit it to page through the whole catalog"
+                ),
+                type=OpenApiTypes.STR,
+                required=False,
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="sync",
+        pagination_class=None,
+    )
+    def sync(self, request):
+        """Get books changed and deleted since the last sync"""
+        changed_since, after_id = None, 0
+        watermark = request.query_params.get("changed_since")
+        if watermark:
+            try:
+                changed_since, after_id = parse_watermark(watermark)
+            except ValueError:
+                return Response(
+                    {"error": "Invalid changed_since"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if changed_since < timezone.now() - TOMBSTONE_RETENTION:
+                return Response(
+                    {"error": "changed_since is too old, sync from scratch"},
+                    status=status.HTTP_410_GONE,
+                )
+
+        changes = get_changes(changed_since, after_id)
+        changes["books"] = self.get_serializer(
+            changes["books"], many=True
+        ).data
+        return Response(changes)
+
+    @extend_schema(responses={200: OpenApiTypes.BINARY})
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="export",
+        permission_classes=(IsAdminUser,),
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def export(self, request):
+        """Stream the whole catalog as CSV or NDJSON (?format=ndjson)"""
+        return stream_export(
+            request, Book.objects.order_by("id"), EXPORT_FIELDS, "books"
+        )
+
+    @extend_schema(
+        request={
+            "text/csv": OpenApiTypes.BINARY,
+            "application/x-ndjson": OpenApiTypes.BINARY,
+        },
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=["POST"], url_path="import")
+    def bulk_import(self, request):
+        """Upsert books from a streamed CSV or NDJSON upload"""
+        content_type = request.content_type.split(";")[0].strip()
+        reader = IMPORT_READERS.get(content_type)
+        if reader is None:
+            return Response(
+                {
+                    "error": "Send text/csv or application/x-ndjson, "
+                             f"not {content_type or 'nothing'}"
+                },
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        if request.stream is None:
+            return Response(
+                {"error": "Empty upload"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            result = import_books(reader(request.stream))
+        except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(result, status=status.HTTP_200_OK)
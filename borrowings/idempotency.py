@@ -0,0 +1,107 @@
+import datetime
+import functools
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.response import Response
+
+from borrowings.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_TTL = datetime.timedelta(hours=24)
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER,
+    description="Unique key to safely retry the request",
+    type=OpenApiTypes.STR,
+    location=OpenApiParameter.HEADER,
+    required=False,
+)
+
+
+def idempotent(view_method):
+    """Replay the stored response for retries with the same key"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} is too long"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = _fingerprint(request)
+        # The key is claimed and the response stored in short transactions
+        # of their own, so no lock is held while the view calls Stripe.
+        # A concurrent retry finds the claim and gets a 409.
+        record, created = IdempotencyKey.objects.get_or_create(
+            user=request.user,
+            key=key,
+            defaults={"fingerprint": fingerprint},
+        )
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {
+                        "error": f"{IDEMPOTENCY_HEADER} was already "
+                                 f"used for a different request"
+                    },
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.response_status is None:
+                return Response(
+                    {
+                        "error": f"A request with this {IDEMPOTENCY_HEADER} "
+                                 f"is still being processed"
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(
+                record.response_body,
+                status=record.response_status,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=["response_status", "response_body"])
+        return response
+
+    return wrapper
+
+
+def purge_idempotency_keys():
+    """django-q task deleting keys older than IDEMPOTENCY_KEY_TTL"""
+    IdempotencyKey.objects.filter(
+        created_at__lt=timezone.now() - IDEMPOTENCY_KEY_TTL
+    ).delete()
+
+
+def _fingerprint(request) -> str:
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.path, data],
+        sort_keys=True,
+        cls=DjangoJSONEncoder,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
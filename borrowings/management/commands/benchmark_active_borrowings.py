@@ -0,0 +1,120 @@
+import datetime
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from books.models import Book
+from borrowings.models import Borrowing
+
+ACTIVE_INDEXES = (
+    "borrowing_active_due_idx",
+    "borrowing_active_user_idx",
+    "borrowing_active_book_idx",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a borrowing history and show the plans of the active and "
+        "overdue scans with and without the partial indexes. Everything "
+        "runs in one transaction that is rolled back, but it locks the "
+        "borrowings table meanwhile, so only run it against a development "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrowings", type=int, default=20_000_000)
+        parser.add_argument(
+            "--active-every",
+            type=int,
+            default=100,
+            help="One in N seeded borrowings is still active",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_id, book_id = self._seed(
+                options["borrowings"], options["active_every"]
+            )
+            today = datetime.date.today()
+            queries = {
+                "overdue scan": Borrowing.objects.filter(
+                    expected_return_date__lt=today,
+                    actual_return_date__isnull=True,
+                )
+                .order_by("id")
+                .values_list("id", flat=True),
+                "active by user": Borrowing.objects.filter(
+                    user_id=user_id, actual_return_date__isnull=True
+                ),
+                "active by book": Borrowing.objects.filter(
+                    book_id=book_id, actual_return_date__isnull=True
+                ),
+            }
+
+            self._report("indexed", queries)
+            with connection.cursor() as cursor:
+                for index in ACTIVE_INDEXES:
+                    cursor.execute(f'DROP INDEX "{index}"')
+            self._report("unindexed", queries)
+
+            transaction.set_rollback(True)
+
+    def _seed(self, borrowings, active_every):
+        prefix = uuid.uuid4().hex
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"benchmark-{prefix}-{i}@example.com")
+            for i in range(1000)
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {i}",
+                author="Benchmark author",
+                inventory=0,
+                daily_fee=1,
+            )
+            for i in range(1000)
+        )
+        table = Borrowing._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (borrowing_date, expected_return_date, "
+                f"actual_return_date, user_id, book_id) "
+                f"SELECT d, d + 14, "
+                f"CASE WHEN n %% %s = 0 THEN NULL ELSE d + 10 END, "
+                f"(%s::bigint[])[n %% 997 + 1], "
+                f"(%s::bigint[])[n / 1000 %% 1000 + 1] "
+                f"FROM generate_series(1, %s) n, "
+                f"LATERAL (SELECT CURRENT_DATE - (n %% 730) AS d) dates",
+                [
+                    active_every,
+                    [user.id for user in users],
+                    [book.id for book in books],
+                    borrowings,
+                ],
+            )
+            cursor.execute(f"ANALYZE {table}")
+            cursor.execute(
+                f"SELECT count(*), count(*) FILTER "
+                f"(WHERE actual_return_date IS NULL) FROM {table}"
+            )
+            total, active = cursor.fetchone()
+        self.stdout.write(f"Borrowings in table: {total} ({active} active)")
+
+        return users[0].id, books[0].id
+
+    def _report(self, label, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{label}:"))
+        for name, queryset in queries.items():
+            # Warm the cache first so neither run pays for cold reads
+            queryset.explain(analyze=True)
+            plan = queryset.explain(analyze=True).splitlines()
+            execution_time = next(
+                line for line in plan if line.startswith("Execution Time")
+            )
+            self.stdout.write(f"  {name}: {execution_time}")
+            scan = next(line for line in plan if "Scan" in line)
+            self.stdout.write(f"    {scan.strip().lstrip('-> ')}")
@@ -5,7 +5,11 @@ from django.core.management.base import BaseCommand
 
 
 class Command(BaseCommand):
-    help = "Schedule overdue notification task"
+    help = (
+        "Schedule overdue notification, notification outbox, "
+        "payment reconciliation, fine accrual "
+        "and idempotency key and book tombstone cleanup tasks"
+    )
 
     def handle(self, *args, **kwargs):
         run_time = make_aware(datetime.combine(datetime.today(), time(9, 0)))
@@ -20,4 +24,57 @@ class Command(BaseCommand):
             },
         )
 
-        self.stdout.write("Scheduled overdue task.")
+        Schedule.objects.update_or_create(
+            name="Drain notification outbox",
+            defaults={
+                "func": "notifications.telegram.drain_notification_outbox",
+                "schedule_type": Schedule.MINUTES,
+                "minutes": 1,
+                "repeats": -1,
+            },
+        )
+
+        Schedule.objects.update_or_create(
+            name="Reconcile pending payments",
+            defaults={
+                "func": "payments.services.reconcile_pending_payments",
+                "schedule_type": Schedule.MINUTES,
+                "minutes": 15,
+                "repeats": -1,
+            },
+        )
+
+        Schedule.objects.update_or_create(
+            name="Accrue fines",
+            defaults={
+                "func": "payments.fines.accrue_fines",
+                "schedule_type": Schedule.DAILY,
+                "next_run": make_aware(
+                    datetime.combine(datetime.today(), time(0, 5))
+                ),
+                "repeats": -1,
+            },
+        )
+
+        Schedule.objects.update_or_create(
+            name="Purge idempotency keys",
+            defaults={
+                "func": "borrowings.idempotency.purge_idempotency_keys",
+                "schedule_type": Schedule.DAILY,
+                "repeats": -1,
+            },
+        )
+
+        Schedule.objects.update_or_create(
+            name="Purge book tombstones",
+            defaults={
+                "func": "books.sync.purge_book_tombstones",
+                "schedule_type": Schedule.DAILY,
+                "repeats": -1,
+            },
+        )
+
+        self.stdout.write(
+            "Scheduled overdue, outbox, reconciliation, fine accrual "
+            "and cleanup tasks."
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 06:34
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the borrowings table stays writable
+    # during the rollout, which requires running outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("books", "0004_book_book_title_trgm_idx_book_book_author_trgm_idx"),
+        ("borrowings", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["expected_return_date"],
+                name="borrowing_active_due_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["user", "expected_return_date"],
+                name="borrowing_active_user_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["book", "expected_return_date"],
+                name="borrowing_active_book_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 06:42
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the borrowings table stays writable
+    # during the rollout, which requires running outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("books", "0004_book_book_title_trgm_idx_book_book_author_trgm_idx"),
+        ("borrowings", "0002_borrowing_active_partial_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["expected_return_date", "id"], name="borrowing_due_id_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["user", "expected_return_date", "id"],
+                name="borrowing_user_due_id_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["book", "expected_return_date", "id"],
+                name="borrowing_book_due_id_idx",
+            ),
+        ),
+    ]
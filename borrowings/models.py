@@ -1,13 +1,15 @@
 import datetime
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import Q, F
 
 from books.models import Book
+from library_service.conditional import VersionedModel
 
 
-class Borrowing(models.Model):
+class Borrowing(VersionedModel):
     borrowing_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(null=True, blank=True)
@@ -28,6 +30,35 @@ class Borrowing(models.Model):
 
     class Meta:
         ordering = ["expected_return_date"]
+        indexes = [
+            models.Index(
+                fields=["expected_return_date", "id"],
+                name="borrowing_due_id_idx",
+            ),
+            models.Index(
+                fields=["user", "expected_return_date", "id"],
+                name="borrowing_user_due_id_idx",
+            ),
+            models.Index(
+                fields=["book", "expected_return_date", "id"],
+                name="borrowing_book_due_id_idx",
+            ),
+            models.Index(
+                fields=["expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_due_idx",
+            ),
+            models.Index(
+                fields=["user", "expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_user_idx",
+            ),
+            models.Index(
+                fields=["book", "expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_book_idx",
+            ),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=Q(expected_return_date__gte=F("borrowing_date")),
@@ -48,5 +79,27 @@ class Borrowing(models.Model):
     def return_borrowing(self):
         self.actual_return_date = datetime.date.today()
         self.book.increase_inventory()
-        self.book.save()
-        self.save()
+        self.save(update_fields=["actual_return_date"])
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotency_unique_user_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.key}"
@@ -0,0 +1,10 @@
+from library_service.pagination import KeysetCursorPagination
+
+
+class BorrowingCursorPagination(KeysetCursorPagination):
+    """Keyset pagination ordered by (expected_return_date, id)"""
+
+    ordering = ("expected_return_date", "id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -4,8 +4,12 @@ from rest_framework import serializers
 
 from books.serializers import BookSerializer
 from borrowings.models import Borrowing
+from library_service.fieldsets import SparseFieldsetSerializerMixin
 from payments.models import Payment
 
+BATCH_BORROWING_LIMIT = 10
+BULK_RETURN_LIMIT = 100
+
 
 class BorrowingPaymentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,7 +17,9 @@ class BorrowingPaymentSerializer(serializers.ModelSerializer):
         fields = ("id", "status", "type", "money_to_pay", "session_url")
 
 
-class BorrowingSerializer(serializers.ModelSerializer):
+class BorrowingSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     payments = BorrowingPaymentSerializer(read_only=True, many=True)
 
     class Meta:
@@ -54,9 +60,49 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
         return actual_return_date
 
 
+class BorrowingBatchCreateSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_BORROWING_LIMIT,
+    )
+    expected_return_date = serializers.DateField()
+
+    def validate_books(self, books):
+        if len(set(books)) != len(books):
+            raise serializers.ValidationError(
+                "Each book can only be borrowed once per checkout."
+            )
+        return books
+
+    def validate_expected_return_date(self, expected_return_date):
+        if expected_return_date < datetime.date.today():
+            raise serializers.ValidationError(
+                "The expected return date cannot precede the borrowing date."
+            )
+        return expected_return_date
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowings = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RETURN_LIMIT,
+    )
+
+    def validate_borrowings(self, borrowings):
+        if len(set(borrowings)) != len(borrowings):
+            raise serializers.ValidationError(
+                "Each borrowing can only be listed once."
+            )
+        return borrowings
+
+
 class BorrowingListSerializer(BorrowingSerializer):
     book = serializers.SlugRelatedField(read_only=True, slug_field="title")
 
+    expandable_fields = {"book": BookSerializer}
+
 
 class BorrowingListAdminSerializer(BorrowingListSerializer):
 
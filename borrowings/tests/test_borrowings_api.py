@@ -1,22 +1,36 @@
+import csv
 import datetime
+import io
+import json
+import time
+from unittest.mock import MagicMock, patch
 
+import stripe
 from attr.setters import validate
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
 from books.models import Book
-from borrowings.models import Borrowing
+from borrowings.models import Borrowing, IdempotencyKey
 from borrowings.serializers import (
     BorrowingListSerializer,
     BorrowingDetailSerializer,
     BorrowingListAdminSerializer,
 )
+from notifications.models import Notification
 from payments.models import Payment
+from payments.services import complete_checkout_session
 
 BORROWINGS_URL = reverse("borrowings:borrowing-list")
+BATCH_URL = reverse("borrowings:borrowing-batch-create")
+BULK_RETURN_URL = reverse("borrowings:borrowing-bulk-return")
+EXPORT_URL = reverse("borrowings:borrowing-export")
 
 
 def get_detail_url(borrow_id):
@@ -85,14 +99,33 @@ class AuthorizedUserTests(BorrowingsAPITestCase):
 
     def test_borrowings_list(self):
         response = self.client.get(BORROWINGS_URL)
-        borrowings = Borrowing.objects.filter(user=self.test_user)
+        borrowings = Borrowing.objects.filter(user=self.test_user).order_by(
+            "expected_return_date", "id"
+        )
         serializer = BorrowingListSerializer(borrowings, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
+
         for borrow in borrowings:
             self.assertEqual(borrow.user, self.test_user)
 
+    def test_borrowings_export_own_only(self):
+        response = self.client.get(EXPORT_URL)
+        rows = list(
+            csv.DictReader(
+                io.StringIO(b"".join(response.streaming_content).decode())
+            )
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            [row["id"] for row in rows], [str(self.borrowing_1.id)]
+        )
+        self.assertEqual(rows[0]["user__email"], "user@test.com")
+        self.assertEqual(rows[0]["book__title"], "Book_1")
+
     def test_borrowings_detail(self):
         url = get_detail_url(self.borrowing_1.id)
         response = self.client.get(url)
@@ -123,6 +156,114 @@ class AuthorizedUserTests(BorrowingsAPITestCase):
         self.assertEqual(borrowing.user, self.test_user)
         self.assertEqual(payment.type, Payment.TransactionType.PAYMENT)
 
+    @patch("borrowings.views.async_task")
+    def test_create_borrowing_defers_checkout_session(self, mock_async_task):
+        book = book_sample()
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book.id,
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BORROWINGS_URL, payload)
+        payment = Payment.objects.get(id=response.data["payment"]["id"])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(payment.status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(response.data["payment"]["session_url"], "")
+        self.assertEqual(
+            mock_async_task.call_args_list[0].args[:2],
+            ("payments.services.create_checkout_session_task", payment.id),
+        )
+
+    def test_create_borrowing_queues_notification(self):
+        book = book_sample()
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book.id,
+        }
+        self.client.post(BORROWINGS_URL, payload)
+        notification = Notification.objects.get()
+
+        self.assertIn("New borrowing created", notification.text)
+        self.assertIn(
+            f"{book.title} ({book.inventory - 1} left)", notification.text
+        )
+
+    def test_create_borrowing_retry_with_idempotency_key(self):
+        book = book_sample()
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book.id,
+        }
+        responses = [
+            self.client.post(
+                BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+            )
+            for _ in range(2)
+        ]
+        book.refresh_from_db()
+
+        self.assertEqual(responses[1].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(responses[1]["Idempotent-Replayed"], "true")
+        self.assertEqual(Borrowing.objects.filter(book=book).count(), 1)
+        self.assertEqual(book.inventory, 9)
+
+    def test_idempotency_key_in_progress(self):
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book_sample().id,
+        }
+        self.client.post(
+            BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+        )
+        # As if the first request were still running
+        IdempotencyKey.objects.update(response_status=None)
+        response = self.client.post(
+            BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_idempotent_view_runs_outside_key_transaction(self):
+        depth = len(connection.atomic_blocks)
+        depths = []
+        original_create = Borrowing.objects.create
+
+        def record_depth(**kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return original_create(**kwargs)
+
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book_sample().id,
+        }
+        with patch.object(Borrowing.objects, "create", record_depth):
+            self.client.post(
+                BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+            )
+
+        # Only the view's own transaction around the borrowing writes
+        self.assertEqual(depths, [depth + 1])
+
+    def test_idempotency_key_reused_for_different_request(self):
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "book": book_sample().id,
+        }
+        self.client.post(
+            BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+        )
+        payload["book"] = book_sample().id
+        response = self.client.post(
+            BORROWINGS_URL, payload, HTTP_IDEMPOTENCY_KEY="create-1"
+        )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
     def test_create_forbidden_when_book_inventory_equal_to_zero(self):
         book = book_sample(inventory=0)
         payload = {
@@ -133,6 +274,67 @@ class AuthorizedUserTests(BorrowingsAPITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @patch("borrowings.views.async_task")
+    def test_batch_create_borrowings(self, mock_async_task):
+        books = [book_sample(), book_sample(inventory=1)]
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "books": [book.id for book in books],
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BATCH_URL, payload, format="json")
+        borrowings = Borrowing.objects.filter(
+            id__in=[item["id"] for item in response.data["borrowings"]]
+        )
+        payment_ids = [item["id"] for item in response.data["payments"]]
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(borrowings.count(), 2)
+        for book in books:
+            book.refresh_from_db()
+        self.assertEqual([book.inventory for book in books], [9, 0])
+        self.assertEqual(
+            Payment.objects.filter(
+                id__in=payment_ids, borrowing__in=borrowings
+            ).count(),
+            2,
+        )
+        mock_async_task.assert_called_once()
+        self.assertEqual(
+            mock_async_task.call_args.args[:2],
+            (
+                "payments.services.create_batch_checkout_session_task",
+                payment_ids,
+            ),
+        )
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_batch_create_rolls_back_when_book_out_of_stock(self):
+        book = book_sample()
+        sold_out = book_sample(inventory=0)
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "books": [book.id, sold_out.id],
+        }
+        response = self.client.post(BATCH_URL, payload, format="json")
+        book.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(sold_out.id), response.data["error"])
+        self.assertEqual(book.inventory, 10)
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+
+    def test_batch_create_rejects_duplicate_books(self):
+        book = book_sample()
+        payload = {
+            "expected_return_date": return_day_sample(),
+            "books": [book.id, book.id],
+        }
+        response = self.client.post(BATCH_URL, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_borrowings_return(self):
         book = book_sample()
         borrowing = Borrowing.objects.create(
@@ -148,7 +350,143 @@ class AuthorizedUserTests(BorrowingsAPITestCase):
         self.assertEqual(
             updated_borrowing.actual_return_date, datetime.date.today()
         )
-        self.assertEqual(updated_borrowing.book.inventory, book.inventory)
+        self.assertEqual(
+            updated_borrowing.book.inventory, book.inventory + 1
+        )
+
+    def test_borrowings_return_retry_with_idempotency_key(self):
+        book = book_sample()
+        borrowing = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            book=book,
+            user=self.test_user,
+        )
+        url = f"{BORROWINGS_URL}{borrowing.id}/return/"
+        responses = [
+            self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+            for _ in range(2)
+        ]
+        book.refresh_from_db()
+
+        self.assertEqual(responses[1].status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(book.inventory, 11)
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_fine_checkout_with_idempotency_key_outside_transaction(
+        self, mock_create
+    ):
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def record_depth(**kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return MagicMock(
+                id="cs_test_fine",
+                url="https://checkout.stripe.com/fine",
+                expires_at=int(time.time()) + 24 * 60 * 60,
+            )
+
+        mock_create.side_effect = record_depth
+        borrowing = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=book_sample(),
+        )
+        Borrowing.objects.filter(id=borrowing.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        url = f"{BORROWINGS_URL}{borrowing.id}/return/"
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(depths, [depth])
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_failed_fine_checkout_releases_idempotency_key(
+        self, mock_create
+    ):
+        mock_create.side_effect = stripe.error.APIConnectionError(
+            "Stripe is down"
+        )
+        borrowing = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=book_sample(),
+        )
+        Borrowing.objects.filter(id=borrowing.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        url = f"{BORROWINGS_URL}{borrowing.id}/return/"
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(borrowing.payments.exists())
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_overdue_return_retry_reuses_fine_session(self, mock_create):
+        mock_create.return_value = MagicMock(
+            id="cs_test_fine",
+            url="https://checkout.stripe.com/fine",
+            expires_at=int(time.time()) + 24 * 60 * 60,
+        )
+        borrowing = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=book_sample(),
+        )
+        Borrowing.objects.filter(id=borrowing.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        url = f"{BORROWINGS_URL}{borrowing.id}/return/"
+        first_response = self.client.post(url)
+        retry_response = self.client.post(url)
+
+        self.assertEqual(first_response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            retry_response.status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            retry_response.data["payment_url"],
+            first_response.data["payment_url"],
+        )
+        mock_create.assert_called_once()
+        self.assertEqual(borrowing.payments.count(), 1)
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_overdue_return_while_fine_session_opens(self, mock_create):
+        borrowing = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=book_sample(),
+        )
+        Borrowing.objects.filter(id=borrowing.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        Payment.objects.create(
+            type=Payment.TransactionType.FINE,
+            borrowing=borrowing,
+            money_to_pay=1,
+            session_claimed_at=timezone.now(),
+        )
+        url = f"{BORROWINGS_URL}{borrowing.id}/return/"
+        response = self.client.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        mock_create.assert_not_called()
 
     def test_borrowings_overdue_return(self):
         book = book_sample()
@@ -185,7 +523,18 @@ class AuthorizedUserTests(BorrowingsAPITestCase):
         self.assertEqual(
             paid_borrowing.actual_return_date, datetime.date.today()
         )
-        self.assertEqual(paid_borrowing.book.inventory, book.inventory)
+        self.assertEqual(
+            paid_borrowing.book.inventory, book.inventory + 1
+        )
+
+    def test_bulk_return_forbidden_for_user(self):
+        response = self.client.post(
+            BULK_RETURN_URL,
+            {"borrowings": [self.borrowing_1.id]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_borrowings_return_twice_forbidden(self):
         book = book_sample()
@@ -208,23 +557,25 @@ class AdminUserTests(BorrowingsAPITestCase):
 
     def test_borrowings_list(self):
         response = self.client.get(BORROWINGS_URL)
-        borrowings = Borrowing.objects.all()
+        borrowings = Borrowing.objects.order_by("expected_return_date", "id")
         serializer = BorrowingListAdminSerializer(borrowings, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), borrowings.count())
+        self.assertEqual(response.data["results"], serializer.data)
+        self.assertEqual(len(response.data["results"]), borrowings.count())
 
     def test_borrowings_filter_by_user_id(self):
         response = self.client.get(
             BORROWINGS_URL, data={"user_id": self.test_user.id}
         )
-        borrowings = Borrowing.objects.filter(user=self.test_user)
+        borrowings = Borrowing.objects.filter(user=self.test_user).order_by(
+            "expected_return_date", "id"
+        )
         serializer = BorrowingListAdminSerializer(borrowings, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), borrowings.count())
+        self.assertEqual(response.data["results"], serializer.data)
+        self.assertEqual(len(response.data["results"]), borrowings.count())
 
     def test_borrowings_filter_by_is_active_status(self):
         book = book_sample()
@@ -235,9 +586,401 @@ class AdminUserTests(BorrowingsAPITestCase):
         )
         borrowing.actual_return_date = datetime.date.today()
         response = self.client.get(BORROWINGS_URL, data={"is_active": True})
-        borrowings = Borrowing.objects.filter(actual_return_date__isnull=True)
+        borrowings = Borrowing.objects.filter(
+            actual_return_date__isnull=True
+        ).order_by("expected_return_date", "id")
         serializer = BorrowingListAdminSerializer(borrowings, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), borrowings.count())
+        self.assertEqual(response.data["results"], serializer.data)
+        self.assertEqual(len(response.data["results"]), borrowings.count())
+
+    def test_borrowings_cursor_pagination(self):
+        book = book_sample()
+        for days in range(1, 26):
+            Borrowing.objects.create(
+                expected_return_date=datetime.date.today()
+                + datetime.timedelta(days=days % 5),
+                user=self.test_user,
+                book=book,
+            )
+
+        response = self.client.get(BORROWINGS_URL, data={"page_size": 10})
+        ids = [borrowing["id"] for borrowing in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [borrowing["id"] for borrowing in response.data["results"]]
+
+        self.assertEqual(
+            ids,
+            list(
+                Borrowing.objects.order_by(
+                    "expected_return_date", "id"
+                ).values_list("id", flat=True)
+            ),
+        )
+
+    def test_borrowings_pages_through_large_due_date_tie(self):
+        book = book_sample()
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                expected_return_date=return_day_sample(),
+                user=self.test_user,
+                book=book,
+            )
+            for _ in range(1100)
+        )
+        expected_ids = list(
+            Borrowing.objects.order_by(
+                "expected_return_date", "id"
+            ).values_list("id", flat=True)
+        )
+
+        response = self.client.get(BORROWINGS_URL, data={"page_size": 100})
+        ids = [borrowing["id"] for borrowing in response.data["results"]]
+        # Bounded, since a cursor stuck inside the tie never runs out
+        while response.data["next"] and len(ids) <= len(expected_ids):
+            response = self.client.get(response.data["next"])
+            ids += [borrowing["id"] for borrowing in response.data["results"]]
+
+        self.assertEqual(ids, expected_ids)
+
+    def test_borrowings_filter_by_book_id(self):
+        response = self.client.get(
+            BORROWINGS_URL, data={"book_id": self.book_2.id}
+        )
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [self.borrowing_2.id],
+        )
+
+    def test_borrowings_filter_by_due_date_range(self):
+        book = book_sample()
+        due_dates = [
+            datetime.date.today() + datetime.timedelta(days=days)
+            for days in (1, 10, 20)
+        ]
+        borrowings = [
+            Borrowing.objects.create(
+                expected_return_date=due_date, user=self.test_user, book=book
+            )
+            for due_date in due_dates
+        ]
+        response = self.client.get(
+            BORROWINGS_URL,
+            data={
+                "book_id": book.id,
+                "due_from": due_dates[1].isoformat(),
+                "due_to": due_dates[2].isoformat(),
+            },
+        )
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [borrowings[1].id, borrowings[2].id],
+        )
+
+    def test_borrowings_filter_by_invalid_date(self):
+        response = self.client.get(BORROWINGS_URL, data={"due_from": "soon"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_borrowings_filter_by_invalid_book_id(self):
+        response = self.client.get(BORROWINGS_URL, data={"book_id": "abc"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("book_id", response.data)
+
+    def test_borrowings_filter_overdue(self):
+        overdue = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=self.book_1,
+        )
+        Borrowing.objects.filter(id=overdue.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        response = self.client.get(BORROWINGS_URL, data={"overdue": "true"})
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [overdue.id],
+        )
+
+    def test_bulk_return(self):
+        book = book_sample()
+        on_time = [
+            Borrowing.objects.create(
+                expected_return_date=return_day_sample(),
+                user=self.test_user,
+                book=book,
+            )
+            for _ in range(2)
+        ]
+        overdue = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=book,
+        )
+        Borrowing.objects.filter(id=overdue.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=3)
+            ),
+        )
+        returned = Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            actual_return_date=datetime.date.today(),
+            user=self.test_user,
+            book=book,
+        )
+        payload = {
+            "borrowings": [
+                on_time[0].id,
+                on_time[1].id,
+                overdue.id,
+                returned.id,
+                returned.id + 1,
+            ]
+        }
+
+        response = self.client.post(BULK_RETURN_URL, payload, format="json")
+        book.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["status"] for item in response.data["results"]],
+            [
+                "returned",
+                "returned",
+                "fine_required",
+                "already_returned",
+                "not_found",
+            ],
+        )
+        self.assertEqual(book.inventory, 12)
+        self.assertEqual(
+            Borrowing.objects.filter(
+                id__in=[borrowing.id for borrowing in on_time],
+                actual_return_date=datetime.date.today(),
+            ).count(),
+            2,
+        )
+        self.assertFalse(
+            Borrowing.objects.get(id=overdue.id).actual_return_date
+        )
+
+    def test_borrowings_export_ndjson_filtered(self):
+        response = self.client.get(
+            EXPORT_URL, {"format": "ndjson", "book_id": self.book_2.id}
+        )
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual([row["id"] for row in rows], [self.borrowing_2.id])
+        self.assertEqual(
+            rows[0]["expected_return_date"],
+            self.borrowing_2.expected_return_date.isoformat(),
+        )
+        self.assertIsNone(rows[0]["actual_return_date"])
+
+
+class BorrowingConditionalGetTests(BorrowingsAPITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+
+    def test_borrowings_list_not_modified(self):
+        etag = self.client.get(BORROWINGS_URL)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                BORROWINGS_URL, HTTP_IF_NONE_MATCH=etag
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_borrowings_list_modified_by_payment(self):
+        etag = self.client.get(BORROWINGS_URL)["ETag"]
+        Payment.objects.create(
+            type=Payment.TransactionType.PAYMENT,
+            borrowing=self.borrowing_1,
+            session_url="https://example.com",
+            session_id="cs_test_etag",
+            money_to_pay=10,
+        )
+        complete_checkout_session("cs_test_etag")
+
+        response = self.client.get(BORROWINGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"][0]["payments"][0]["status"],
+            Payment.PaymentStatus.PAID,
+        )
+
+    def test_borrowings_list_modified_by_new_borrowing(self):
+        etag = self.client.get(BORROWINGS_URL)["ETag"]
+        Borrowing.objects.create(
+            expected_return_date=return_day_sample(),
+            user=self.test_user,
+            book=self.book_2,
+        )
+
+        response = self.client.get(BORROWINGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_borrowings_list_not_modified_across_pages(self):
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                expected_return_date=return_day_sample(),
+                user=self.test_user,
+                book=self.book_1,
+            )
+            for _ in range(30)
+        )
+        first = self.client.get(BORROWINGS_URL)
+        second = self.client.get(first.data["next"])
+
+        for response in (first, second):
+            url = response.wsgi_request.get_full_path()
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+            self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(cached["ETag"], response["ETag"])
+
+        self.assertEqual(len(first.data["results"]), 20)
+        self.assertEqual(len(second.data["results"]), 11)
+        self.assertIsNone(second.data["next"])
+
+    def test_borrowings_list_modified_page_keeps_next_link(self):
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                expected_return_date=return_day_sample(),
+                user=self.test_user,
+                book=self.book_1,
+            )
+            for _ in range(30)
+        )
+        first = self.client.get(BORROWINGS_URL)
+        Borrowing.bump_versions([first.data["results"][0]["id"]])
+
+        response = self.client.get(
+            BORROWINGS_URL, HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.data["next"])
+        self.assertEqual(response.data["next"], first.data["next"])
+
+    def test_borrowings_detail_not_modified(self):
+        url = get_detail_url(self.borrowing_1.id)
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_borrowings_detail_modified_by_book(self):
+        url = get_detail_url(self.borrowing_1.id)
+        etag = self.client.get(url)["ETag"]
+        self.book_1.reduce_inventory()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["book"]["inventory"], 9)
+
+
+class BorrowingSparseFieldsetTests(BorrowingsAPITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_admin)
+        Payment.objects.create(
+            type=Payment.TransactionType.PAYMENT,
+            borrowing=self.borrowing_1,
+            money_to_pay=10,
+        )
+
+    def test_borrowings_list_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                BORROWINGS_URL, {"fields": "id,expected_return_date"}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data["results"][0]), {"id", "expected_return_date"}
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("books_book", queries[0]["sql"])
+        self.assertNotIn("users_user", queries[0]["sql"])
+
+    def test_borrowings_list_fields_with_payments(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                BORROWINGS_URL, {"fields": "id,payments"}
+            )
+        borrowing = next(
+            item
+            for item in response.data["results"]
+            if item["id"] == self.borrowing_1.id
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(borrowing), {"id", "payments"})
+        self.assertEqual(len(borrowing["payments"]), 1)
+
+    def test_borrowings_list_expand_book(self):
+        response = self.client.get(
+            BORROWINGS_URL, {"fields": "id,book", "expand": "book"}
+        )
+        borrowing = next(
+            item
+            for item in response.data["results"]
+            if item["id"] == self.borrowing_1.id
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(borrowing["book"]["title"], "Book_1")
+        self.assertEqual(borrowing["book"]["inventory"], 10)
+
+    def test_borrowings_list_sparse_fields_not_modified(self):
+        params = {"fields": "id,actual_return_date"}
+        etag = self.client.get(BORROWINGS_URL, params)["ETag"]
+        full_etag = self.client.get(BORROWINGS_URL)["ETag"]
+        self.book_1.reduce_inventory()
+
+        response = self.client.get(
+            BORROWINGS_URL, params, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertNotEqual(etag, full_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_borrowings_detail_sparse_fields(self):
+        response = self.client.get(
+            get_detail_url(self.borrowing_1.id), {"fields": "id,user"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {"id": self.borrowing_1.id, "user": self.test_user.id},
+        )
+
+    def test_borrowings_list_invalid_expand(self):
+        response = self.client.get(BORROWINGS_URL, {"expand": "payments"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
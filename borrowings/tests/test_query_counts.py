@@ -0,0 +1,94 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import Payment
+
+BORROWINGS_URL = reverse("borrowings:borrowing-list")
+BULK_RETURN_URL = reverse("borrowings:borrowing-bulk-return")
+
+LIST_QUERY_BUDGET = 2
+DETAIL_QUERY_BUDGET = 2
+# Savepoints included: two selects and two updates whatever the batch size
+BULK_RETURN_QUERY_BUDGET = 8
+
+
+def get_detail_url(borrow_id):
+    return reverse("borrowings:borrowing-detail", args=[borrow_id])
+
+
+def seed_borrowings(user, count):
+    borrowings = []
+    for i in range(count):
+        book = Book.objects.create(
+            title=f"Seed book {i}",
+            author=f"Seed author {i}",
+            inventory=10,
+            daily_fee=0.50,
+        )
+        borrowing = Borrowing.objects.create(
+            expected_return_date=datetime.date.today()
+            + datetime.timedelta(days=i + 1),
+            user=user,
+            book=book,
+        )
+        for transaction_type in Payment.TransactionType:
+            Payment.objects.create(
+                type=transaction_type,
+                borrowing=borrowing,
+                session_url="https://example.com",
+                session_id=f"cs_seed_{borrowing.id}_{transaction_type}",
+                money_to_pay=10,
+            )
+        borrowings.append(borrowing)
+    return borrowings
+
+
+class BorrowingQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.test_admin = get_user_model().objects.create(
+            email="admin@test.com", password="1qazcde3", is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+
+    def test_list_query_count_independent_of_size(self):
+        for count in (2, 20):
+            seed_borrowings(self.test_user, count)
+            with self.assertNumQueries(LIST_QUERY_BUDGET):
+                self.client.get(BORROWINGS_URL)
+
+    def test_admin_list_query_count_independent_of_size(self):
+        self.client.force_authenticate(user=self.test_admin)
+        for count in (2, 20):
+            seed_borrowings(self.test_user, count)
+            with self.assertNumQueries(LIST_QUERY_BUDGET):
+                self.client.get(BORROWINGS_URL)
+
+    def test_detail_query_count(self):
+        borrowing = seed_borrowings(self.test_user, 1)[0]
+
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            self.client.get(get_detail_url(borrowing.id))
+
+    def test_bulk_return_query_count_independent_of_size(self):
+        self.client.force_authenticate(user=self.test_admin)
+        for count in (2, 20):
+            borrowings = seed_borrowings(self.test_user, count)
+            with self.assertNumQueries(BULK_RETURN_QUERY_BUDGET):
+                self.client.post(
+                    BULK_RETURN_URL,
+                    {"borrowings": [borrowing.id for borrowing in borrowings]},
+                    format="json",
+                )
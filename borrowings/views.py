@@ -1,56 +1,201 @@
 import datetime
+from collections import Counter
+from operator import attrgetter
 
+import stripe
 from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils.dateparse import parse_date
 from django.http import HttpRequest
+from django_q.tasks import async_task
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from books.models import Book
+from borrowings.idempotency import idempotent, IDEMPOTENCY_KEY_PARAMETER
 from borrowings.models import Borrowing
+from borrowings.pagination import BorrowingCursorPagination
 from borrowings.serializers import (
     BorrowingSerializer,
+    BorrowingBatchCreateSerializer,
+    BorrowingBulkReturnSerializer,
     BorrowingListSerializer,
     BorrowingDetailSerializer,
     BorrowingCreateSerializer,
     BorrowingListAdminSerializer,
     BorrowingDetailAdminSerializer,
     BorrowingReturnSerializer,
+    BorrowingPaymentSerializer,
+)
+from library_service.conditional import (
+    conditional_response,
+    make_etag,
+    set_validators,
+)
+from library_service.exports import EXPORT_RENDERERS, stream_export
+from library_service.fieldsets import (
+    SPARSE_FIELDSET_PARAMETERS,
+    SparseFieldsetViewMixin,
+)
+from notifications.telegram import (
+    borrowing_create_notification,
+    borrowings_batch_create_notification,
 )
-from notifications.telegram import borrowing_create_notification
 from payments.models import Payment
-from payments.services import create_checkout_session
+from payments.services import (
+    create_payment,
+    create_payments,
+    get_checkout_urls,
+    get_or_create_checkout_session,
+)
+
+EXPORT_FIELDS = (
+    "id",
+    "borrowing_date",
+    "expected_return_date",
+    "actual_return_date",
+    "user_id",
+    "user__email",
+    "book_id",
+    "book__title",
+)
+
+BORROWING_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        name="is_active",
+        description="Filter borrowings by status",
+        type=OpenApiTypes.BOOL,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="overdue",
+        description="Only active borrowings past their return date",
+        type=OpenApiTypes.BOOL,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="user_id",
+        description="Filter borrowings by user_id",
+        type=OpenApiTypes.INT,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="book_id",
+        description="Filter borrowings by book_id",
+        type=OpenApiTypes.INT,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="due_from",
+        description="Expected return date on or after (YYYY-MM-DD)",
+        type=OpenApiTypes.DATE,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="due_to",
+        description="Expected return date on or before (YYYY-MM-DD)",
+        type=OpenApiTypes.DATE,
+        required=False,
+    ),
+]
 
 
 class BorrowingViewSet(
+    SparseFieldsetViewMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
     GenericViewSet,
 ):
-    queryset = Borrowing.objects.select_related("book", "user")
+    queryset = Borrowing.objects.select_related(
+        "book", "user"
+    ).prefetch_related("payments")
     serializer_class = BorrowingSerializer
+    pagination_class = BorrowingCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        queryset = self.queryset
+        queryset = self.queryset.all()
         if not user.is_staff:
-            queryset = self.queryset.filter(user=user)
+            queryset = queryset.filter(user=user)
 
         status = self.request.query_params.get("is_active")
-        user_id = self.request.query_params.get("user_id")
+        overdue = self.request.query_params.get("overdue")
+        user_id = self._get_id_param("user_id")
+        book_id = self._get_id_param("book_id")
+        due_from = self._get_date_param("due_from")
+        due_to = self._get_date_param("due_to")
 
         if status:
             queryset = queryset.filter(actual_return_date__isnull=True)
 
+        if overdue == "true":
+            queryset = queryset.filter(
+                actual_return_date__isnull=True,
+                expected_return_date__lt=datetime.date.today(),
+            )
+
         if user_id:
             queryset = queryset.filter(user_id=user_id)
 
+        if book_id:
+            queryset = queryset.filter(book_id=book_id)
+
+        if due_from:
+            queryset = queryset.filter(expected_return_date__gte=due_from)
+
+        if due_to:
+            queryset = queryset.filter(expected_return_date__lte=due_to)
+
+        if self.action in self.sparse_fieldset_actions:
+            queryset = self._narrow_queryset(queryset)
+
         return queryset
 
+    def _narrow_queryset(self, queryset):
+        """Load only the columns and relations the requested fields show"""
+        fields = self.requested_fields
+        if fields is None:
+            return queryset
+
+        queryset = queryset.select_related(None).prefetch_related(None)
+        # The keyset pagination and the ETag need these whatever is shown
+        columns = {"id", "expected_return_date", "version"}
+        columns |= fields & {"borrowing_date", "actual_return_date", "user"}
+        if "book" in fields:
+            queryset = queryset.select_related("book")
+            columns.add("book")
+        if "payments" in fields:
+            queryset = queryset.prefetch_related("payments")
+        return queryset.only(*columns)
+
+    def _get_id_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "Use an integer id."})
+
+    def _get_date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValidationError({name: "Use the YYYY-MM-DD format."})
+        return date
+
     def get_serializer_class(self):
         if self.action == "list":
             if self.request.user.is_staff:
@@ -65,20 +210,29 @@ class BorrowingViewSet(
         if self.action == "create":
             return BorrowingCreateSerializer
 
+        if self.action == "batch_create":
+            return BorrowingBatchCreateSerializer
+
         if self.action == "return_book":
             return BorrowingReturnSerializer
 
+        if self.action == "bulk_return":
+            return BorrowingBulkReturnSerializer
+
         return BorrowingSerializer
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def create(self, request: HttpRequest, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         book = serializer.validated_data["book"]
 
-        with transaction.atomic():
-            book_for_update = Book.objects.select_for_update().get(pk=book.pk)
-            if book_for_update.inventory > 0:
-                book_for_update.reduce_inventory()
+        success_url, cancel_url = get_checkout_urls(request)
+
+        try:
+            with transaction.atomic():
+                book.reduce_inventory()
                 borrowing = Borrowing.objects.create(
                     book=book,
                     borrowing_date=serializer.validated_data.get(
@@ -89,45 +243,174 @@ class BorrowingViewSet(
                     ),
                     user=request.user,
                 )
-                payment_url = create_checkout_session(
-                    borrowing, Payment.TransactionType.PAYMENT, request
+                payment = create_payment(
+                    borrowing, Payment.TransactionType.PAYMENT
                 )
                 transaction.on_commit(
-                    lambda: borrowing_create_notification(borrowing)
+                    lambda: async_task(
+                        "payments.services.create_checkout_session_task",
+                        payment.id,
+                        success_url,
+                        cancel_url,
+                    )
                 )
-                return Response(
-                    {
-                        "borrowing": self.get_serializer(borrowing).data,
-                        "payment_url": payment_url,
-                    },
-                    status=201,
+                borrowing_create_notification(borrowing)
+        except ValidationError:
+            return Response(
+                {"error": "This book is out of stock"}, status=400
+            )
+
+        return Response(
+            {
+                "borrowing": self.get_serializer(borrowing).data,
+                "payment": BorrowingPaymentSerializer(payment).data,
+            },
+            status=201,
+        )
+
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @action(detail=False, methods=["POST"], url_path="batch")
+    @idempotent
+    def batch_create(self, request):
+        """Borrow several books with one checkout session"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        book_ids = serializer.validated_data["books"]
+        expected_return_date = serializer.validated_data[
+            "expected_return_date"
+        ]
+
+        success_url, cancel_url = get_checkout_urls(request)
+
+        try:
+            with transaction.atomic():
+                inventories = Book.reduce_inventories(book_ids)
+                books = Book.objects.in_bulk(book_ids)
+                borrowings = Borrowing.objects.bulk_create(
+                    Borrowing(
+                        book=books[book_id],
+                        expected_return_date=expected_return_date,
+                        user=request.user,
+                    )
+                    for book_id in book_ids
                 )
-            else:
-                return Response(
-                    {"error": "This book is out of stock"}, status=400
+                payments = create_payments(
+                    borrowings, Payment.TransactionType.PAYMENT
+                )
+                transaction.on_commit(
+                    lambda: async_task(
+                        "payments.services."
+                        "create_batch_checkout_session_task",
+                        [payment.id for payment in payments],
+                        success_url,
+                        cancel_url,
+                    )
                 )
+                for book in books.values():
+                    book.inventory = inventories[book.id]
+                borrowings_batch_create_notification(borrowings)
+        except ValidationError as e:
+            return Response(
+                {"error": e.detail[0]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "borrowings": BorrowingCreateSerializer(
+                    borrowings, many=True
+                ).data,
+                "payments": BorrowingPaymentSerializer(
+                    payments, many=True
+                ).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
 
     @extend_schema(
-        parameters=[
-            OpenApiParameter(
-                name="is_active",
-                description="Filter borrowings by status",
-                type=OpenApiTypes.BOOL,
-                required=False,
-            ),
-            OpenApiParameter(
-                name="user_id",
-                description="Filter borrowings by user_id",
-                type=OpenApiTypes.INT,
-                required=False,
-            ),
-        ]
+        parameters=BORROWING_FILTER_PARAMETERS + SPARSE_FIELDSET_PARAMETERS
     )
     def list(self, request, *args, **kwargs):
-        """Get list of borrowings"""
-        return super().list(request, *args, **kwargs)
+        """Get list of borrowings, or 304 if the page is unchanged"""
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            versions = self.paginate_queryset(self._only_versions(queryset))
+            response = conditional_response(
+                request, self._get_etag(map(self._get_versions, versions))
+            )
+            if response is not None:
+                return response
 
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return set_validators(
+            self.get_paginated_response(serializer.data),
+            self._get_etag(map(self._get_versions, page)),
+        )
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        """Get borrowing detail, or 304 if it is unchanged"""
+        if "HTTP_IF_NONE_MATCH" in request.META and kwargs["pk"].isdigit():
+            versions = list(
+                self.get_queryset()
+                .filter(pk=kwargs["pk"])
+                .values_list(*self._get_version_lookups())
+            )
+            if versions:
+                response = conditional_response(
+                    request, self._get_etag(versions)
+                )
+                if response is not None:
+                    return response
+
+        borrowing = self.get_object()
+        serializer = self.get_serializer(borrowing)
+        return set_validators(
+            Response(serializer.data),
+            self._get_etag([self._get_versions(borrowing)]),
+        )
+
+    def _only_versions(self, queryset):
+        """Load just the columns of the ETag and the pagination cursor"""
+        queryset = queryset.select_related(None).prefetch_related(None)
+        columns = {*self.pagination_class.ordering, "id", "version"}
+        if self.shows_field("book"):
+            queryset = queryset.select_related("book")
+            columns |= {"book", "book__version"}
+        return queryset.only(*columns)
+
+    def _get_version_lookups(self) -> tuple[str, ...]:
+        if self.shows_field("book"):
+            return "id", "version", "book__version"
+        return "id", "version"
+
+    def _get_versions(self, borrowing) -> tuple:
+        lookups = self._get_version_lookups()
+        return attrgetter(
+            *(lookup.replace("__", ".") for lookup in lookups)
+        )(borrowing)
+
+    def _get_etag(self, versions) -> str:
+        """Fingerprint the (id, version[, book version]) rows of a response
+
+        Payment writes bump the borrowing version too, so together these
+        cover everything the borrowing serializers embed.
+        """
+        paginator = self.paginator if self.action == "list" else None
+        return make_etag(
+            self.request.user.is_staff,
+            sorted(self.requested_fields or ()),
+            sorted(self.requested_expand),
+            getattr(paginator, "has_next", None),
+            getattr(paginator, "has_previous", None),
+            *(".".join(map(str, row)) for row in versions),
+        )
+
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
     @action(detail=True, methods=["POST"], url_path="return")
+    @idempotent
     def return_book(self, request, pk=None):
         """Endpoint for borrowing return functionality"""
         borrowing = self.get_object()
@@ -147,34 +430,134 @@ class BorrowingViewSet(
             )
 
         if borrowing.expected_return_date < today:
-            fine_payment = borrowing.payments.filter(
-                type=Payment.TransactionType.FINE
-            ).first()
-            if fine_payment:
-                if fine_payment.status == Payment.PaymentStatus.PAID:
-                    borrowing.return_borrowing()
-                    return Response(
-                        {"message": "You have successfully returned the book"},
-                        status=status.HTTP_200_OK,
-                    )
-                else:
-                    return Response(
-                        {
-                            "message": "You have to pay the fine "
-                                       "before returning the book",
-                            "payment_url": fine_payment.session_url,
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-            else:
-                session_url = create_checkout_session(
-                    borrowing, Payment.TransactionType.FINE, request
+            if borrowing.payments.filter(
+                type=Payment.TransactionType.FINE,
+                status=Payment.PaymentStatus.PAID,
+            ).exists():
+                borrowing.return_borrowing()
+                return Response(
+                    {"message": "You have successfully returned the book"},
+                    status=status.HTTP_200_OK,
                 )
+
+            try:
+                fine_payment, created = get_or_create_checkout_session(
+                    borrowing,
+                    Payment.TransactionType.FINE,
+                    *get_checkout_urls(request),
+                )
+            except stripe.error.StripeError as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+
+            if not fine_payment.session_url:
+                return Response(
+                    {"error": "The fine payment session is being opened, "
+                              "please retry shortly"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if created:
                 return Response(
                     {
                         "message": "You are late! Please pay the "
                                    "fine before returning the book.",
-                        "payment_url": session_url,
+                        "payment_url": fine_payment.session_url,
                     },
                     status=status.HTTP_202_ACCEPTED,
                 )
+            return Response(
+                {
+                    "message": "You have to pay the fine "
+                               "before returning the book",
+                    "payment_url": fine_payment.session_url,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk-return",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_return(self, request):
+        """Return many borrowings at once for front-desk staff"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        borrowing_ids = serializer.validated_data["borrowings"]
+        today = datetime.date.today()
+
+        with transaction.atomic():
+            borrowings = {
+                borrowing["id"]: borrowing
+                for borrowing in Borrowing.objects.select_for_update()
+                .filter(id__in=borrowing_ids)
+                .annotate(
+                    fine_paid=Exists(
+                        Payment.objects.filter(
+                            borrowing=OuterRef("pk"),
+                            type=Payment.TransactionType.FINE,
+                            status=Payment.PaymentStatus.PAID,
+                        )
+                    )
+                )
+                .order_by("id")
+                .values(
+                    "id",
+                    "book_id",
+                    "expected_return_date",
+                    "actual_return_date",
+                    "fine_paid",
+                )
+            }
+
+            results = []
+            returned = []
+            for borrowing_id in borrowing_ids:
+                borrowing = borrowings.get(borrowing_id)
+                if borrowing is None:
+                    outcome = "not_found"
+                elif borrowing["actual_return_date"]:
+                    outcome = "already_returned"
+                elif (
+                    borrowing["expected_return_date"] < today
+                    and not borrowing["fine_paid"]
+                ):
+                    outcome = "fine_required"
+                else:
+                    outcome = "returned"
+                    returned.append(borrowing)
+                results.append({"id": borrowing_id, "status": outcome})
+
+            if returned:
+                Borrowing.objects.filter(
+                    id__in=[borrowing["id"] for borrowing in returned]
+                ).update(
+                    actual_return_date=today, version=F("version") + 1
+                )
+                Book.increase_inventories(
+                    Counter(borrowing["book_id"] for borrowing in returned)
+                )
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=BORROWING_FILTER_PARAMETERS,
+        responses={200: OpenApiTypes.BINARY},
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="export",
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def export(self, request):
+        """Stream borrowing history as CSV or NDJSON (?format=ndjson)"""
+        return stream_export(
+            request,
+            self.get_queryset().order_by("id"),
+            EXPORT_FIELDS,
+            "borrowings",
+        )
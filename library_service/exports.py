@@ -0,0 +1,87 @@
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class CSVExportRenderer(JSONRenderer):
+    """Lets DRF negotiate ?format=csv; errors are still rendered as JSON"""
+
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONExportRenderer(JSONRenderer):
+    """Lets DRF negotiate ?format=ndjson; errors are rendered as JSON"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+EXPORT_RENDERERS = (CSVExportRenderer, NDJSONExportRenderer)
+
+
+def stream_export(request, queryset, fields, filename):
+    """Stream the fields of every queryset row as CSV or NDJSON
+
+    Rows are read through a server-side cursor and flushed a chunk at a
+    time, so memory stays flat whatever the table size. The header goes
+    out before the query runs so the client gets bytes straight away.
+    Only the fields are selected, without model instances or prefetches.
+    """
+    export_format = request.accepted_renderer.format
+    rows = (
+        queryset.prefetch_related(None)
+        .values_list(*fields)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if export_format == NDJSONExportRenderer.format:
+        chunks = _ndjson_chunks(fields, rows)
+    else:
+        chunks = _csv_chunks(fields, rows)
+
+    response = StreamingHttpResponse(
+        chunks, content_type=request.accepted_renderer.media_type
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{filename}.{export_format}"'
+    )
+    # Keep nginx from buffering the whole export before sending it on
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _csv_chunks(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield _drain(buffer)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def _ndjson_chunks(fields, rows):
+    # encode() takes the C encoder fast path that json.dump() never does
+    encoder = DjangoJSONEncoder()
+    buffer = io.StringIO()
+    for count, row in enumerate(rows, start=1):
+        buffer.write(encoder.encode(dict(zip(fields, row))))
+        buffer.write("\n")
+        # NDJSON has no header, so the first row is flushed on its own
+        if count == 1 or count % EXPORT_CHUNK_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def _drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
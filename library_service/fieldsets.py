@@ -0,0 +1,80 @@
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ValidationError
+
+SPARSE_FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        description="Comma-separated fields to return, all by default",
+        type=OpenApiTypes.STR,
+        required=False,
+    ),
+    OpenApiParameter(
+        name="expand",
+        description="Comma-separated relations to nest instead of ids",
+        type=OpenApiTypes.STR,
+        required=False,
+    ),
+]
+
+
+def parse_field_list(request, name: str) -> frozenset[str] | None:
+    """Read a comma-separated query parameter, None when it is absent"""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return frozenset(item.strip() for item in value.split(",") if item.strip())
+
+
+class SparseFieldsetSerializerMixin:
+    """Serializer mixin keeping only the requested fields
+
+    Relations in expandable_fields map to the serializer that nests them
+    when expanded, instead of their default id or slug field.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        unknown = (expand or set()) - set(self.expandable_fields)
+        if unknown:
+            raise ValidationError(
+                {"expand": f"Cannot expand {', '.join(sorted(unknown))}"}
+            )
+        for name in expand or ():
+            self.fields[name] = self.expandable_fields[name](read_only=True)
+
+        if fields is None:
+            return
+        unknown = fields - set(self.fields)
+        if unknown:
+            raise ValidationError(
+                {"fields": f"Unknown fields {', '.join(sorted(unknown))}"}
+            )
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """Passes ?fields= and ?expand= to the list and retrieve serializers"""
+
+    sparse_fieldset_actions = ("list", "retrieve")
+
+    @property
+    def requested_fields(self) -> frozenset[str] | None:
+        return parse_field_list(self.request, "fields")
+
+    @property
+    def requested_expand(self) -> frozenset[str]:
+        return parse_field_list(self.request, "expand") or frozenset()
+
+    def shows_field(self, name: str) -> bool:
+        fields = self.requested_fields
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_fieldset_actions:
+            kwargs.setdefault("fields", self.requested_fields)
+            kwargs.setdefault("expand", self.requested_expand)
+        return super().get_serializer(*args, **kwargs)
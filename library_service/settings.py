@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "drf_spectacular",
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
     "payments",
     "users",
     "books",
+    "notifications",
 ]
 
 MIDDLEWARE = [
@@ -194,4 +196,18 @@ Q_CLUSTER = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": (
+            f"redis://{getenv('REDIS_HOST')}:{getenv('REDIS_PORT')}/"
+            f"{getenv('REDIS_DB')}"
+        ),
+        "KEY_PREFIX": "library",
+    }
+}
+
+BOOK_CACHE_TIMEOUT = 60 * 15
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
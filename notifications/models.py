@@ -0,0 +1,34 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Notification(models.Model):
+    class NotificationStatus(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    chat_id = models.CharField(max_length=64)
+    text = models.TextField()
+    status = models.CharField(
+        max_length=7,
+        choices=NotificationStatus,
+        default=NotificationStatus.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["chat_id", "next_attempt_at"],
+                condition=Q(status="PENDING"),
+                name="notification_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id} - {self.status} - {self.created_at}"
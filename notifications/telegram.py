@@ -1,18 +1,53 @@
 import datetime
 import logging
+import secrets
+import time
+from html import escape
 from os import getenv
 
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_q.tasks import async_task
 from dotenv import load_dotenv
 from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
 
 from borrowings.models import Borrowing
+from notifications.models import Notification
+from notifications.rate_limit import TokenBucket
 
 load_dotenv()
 
 TOKEN = getenv("BOT_TOKEN")
 CHAT_ID = getenv("CHAT_ID")
 
+OVERDUE_CHUNK_SIZE = 500
+TELEGRAM_MESSAGE_LIMIT = 4096
+NOTIFICATION_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 30
+COALESCE_LIMIT = 100
+DRAIN_LOCK_KEY = "notifications:drain:lock"
+DRAIN_TIME_LIMIT = 60
+# Deletes the lock only while it still holds the token of the caller
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Telegram allows ~20 messages per minute in a group chat
+# and ~30 messages per second across all chats.
+TELEGRAM_CHAT_RATE = 20 / 60
+TELEGRAM_GLOBAL_RATE = 30
+
 bot = Bot(token=TOKEN)
+global_bucket = TokenBucket(
+    TELEGRAM_GLOBAL_RATE, capacity=TELEGRAM_GLOBAL_RATE
+)
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -20,12 +55,111 @@ logging.basicConfig(
 )
 
 
-def send_notification(message: str):
+def send_notification(message: str, chat_id: str = CHAT_ID):
+    """Queue the message in the outbox; drain_notification_outbox sends it"""
+    Notification.objects.create(chat_id=chat_id or "", text=message)
+    transaction.on_commit(
+        lambda: async_task("notifications.telegram.drain_notification_outbox")
+    )
+
+
+def drain_notification_outbox():
+    """
+    django-q task delivering queued notifications within Telegram rate
+    limits. Pending messages of the same chat are coalesced into one.
+    """
+    # A drain outliving the timeout must not release a lock taken since
+    token = secrets.randbits(63)
+    if not cache.add(DRAIN_LOCK_KEY, token, timeout=DRAIN_TIME_LIMIT * 2):
+        return
+
+    try:
+        deadline = time.monotonic() + DRAIN_TIME_LIMIT
+        chat_buckets = {}
+        while time.monotonic() < deadline:
+            chat_ids = list(
+                _due_notifications()
+                .values_list("chat_id", flat=True)
+                .distinct()
+            )
+            if not chat_ids:
+                break
+            for chat_id in chat_ids:
+                if chat_id not in chat_buckets:
+                    chat_buckets[chat_id] = TokenBucket(
+                        TELEGRAM_CHAT_RATE, capacity=1
+                    )
+                chat_buckets[chat_id].acquire()
+                global_bucket.acquire()
+                _deliver_batch(chat_id)
+    finally:
+        _release_lock(DRAIN_LOCK_KEY, token)
+
+
+def _release_lock(key: str, token: int):
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        # Integers are stored unpickled, so the script can compare them
+        key = backend.make_and_validate_key(key)
+        client = backend._cache.get_client(key, write=True)
+        client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+    elif backend.get(key) == token:
+        backend.delete(key)
+
+
+def _due_notifications():
+    return Notification.objects.filter(
+        status=Notification.NotificationStatus.PENDING,
+        next_attempt_at__lte=timezone.now(),
+    )
+
+
+def _deliver_batch(chat_id: str):
+    notifications = _due_notifications().filter(chat_id=chat_id).order_by(
+        "id"
+    )[:COALESCE_LIMIT]
+    batch = []
+    text = ""
+    for notification in notifications:
+        candidate = f"{text}\n\n{notification.text}" if text else (
+            notification.text
+        )
+        if batch and len(candidate) > TELEGRAM_MESSAGE_LIMIT:
+            break
+        batch.append(notification)
+        text = candidate
+    if not batch:
+        return
+    sent = Notification.objects.filter(id__in=[item.id for item in batch])
+
     try:
-        bot.send_message(chat_id=CHAT_ID, text=message, parse_mode="HTML")
-        logging.info("Message sent to Telegram")
-    except Exception as e:
+        bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+    except RetryAfter as e:
+        logging.warning(f"Telegram rate limit hit, retry in {e.retry_after}s")
+        sent.update(
+            next_attempt_at=timezone.now()
+            + datetime.timedelta(seconds=e.retry_after)
+        )
+        return
+    except TelegramError as e:
         logging.error(f"Failed to send Telegram message: {e}")
+        attempts = max(item.attempts for item in batch) + 1
+        sent.update(
+            attempts=F("attempts") + 1,
+            next_attempt_at=timezone.now()
+            + datetime.timedelta(
+                seconds=NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1)
+            ),
+        )
+        sent.filter(attempts__gte=NOTIFICATION_ATTEMPTS).update(
+            status=Notification.NotificationStatus.FAILED
+        )
+        return
+
+    sent.update(
+        status=Notification.NotificationStatus.SENT, sent_at=timezone.now()
+    )
+    logging.info(f"Sent {len(batch)} notification(s) to Telegram")
 
 
 def borrowing_create_notification(borrowing: Borrowing):
@@ -34,26 +168,75 @@ def borrowing_create_notification(borrowing: Borrowing):
     message = (
         f"<b>New borrowing created!</b>\n"
         f"User: {user.email}\n"
-        f"Book: {book.title} ({book.inventory - 1} left)\n"
+        f"Book: {book.title} ({book.inventory} left)\n"
         f"Exp. return date: {borrowing.expected_return_date}\n"
     )
     send_notification(message)
 
 
+def borrowings_batch_create_notification(borrowings: list[Borrowing]):
+    """One message for all borrowings of a multi-book checkout"""
+    books = "\n".join(
+        f"- {escape(borrowing.book.title)} "
+        f"({borrowing.book.inventory} left)"
+        for borrowing in borrowings
+    )
+    message = (
+        f"<b>New borrowings created!</b>\n"
+        f"User: {escape(borrowings[0].user.email)}\n"
+        f"Books:\n{books}\n"
+        f"Exp. return date: {borrowings[0].expected_return_date}\n"
+    )
+    send_notification(message)
+
+
 def check_overdue_borrowings():
+    """Fan the overdue scan out as one digest task per chunk of borrowings"""
     today = datetime.date.today()
-    overdue_borrowings = Borrowing.objects.filter(
-        expected_return_date__lt=today, actual_return_date__isnull=True
+    overdue_ids = (
+        Borrowing.objects.filter(
+            expected_return_date__lt=today, actual_return_date__isnull=True
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=OVERDUE_CHUNK_SIZE)
     )
 
-    if overdue_borrowings.exists():
-        for borrowing in overdue_borrowings:
-            message = (
-                f"<b>Overdue borrowing alert!</b>\n"
-                f"User: {borrowing.user.email}\n"
-                f"Book: {borrowing.book.title}\n"
-                f"Expected return: {borrowing.expected_return_date}"
-            )
-            send_notification(message)
-    else:
+    chunk = []
+    chunks_count = 0
+    for borrowing_id in overdue_ids:
+        chunk.append(borrowing_id)
+        if len(chunk) == OVERDUE_CHUNK_SIZE:
+            async_task("notifications.telegram.send_overdue_digest", chunk)
+            chunks_count += 1
+            chunk = []
+    if chunk:
+        async_task("notifications.telegram.send_overdue_digest", chunk)
+        chunks_count += 1
+
+    if not chunks_count:
         send_notification("📢 No borrowings overdue today!")
+
+
+def send_overdue_digest(borrowing_ids: list[int]):
+    """Send overdue borrowings of one chunk as a few grouped messages"""
+    borrowings = (
+        Borrowing.objects.filter(id__in=borrowing_ids)
+        .select_related("user", "book")
+        .only("expected_return_date", "user__email", "book__title")
+        .order_by("expected_return_date", "id")
+    )
+    header = "<b>Overdue borrowings alert!</b>\n"
+    message = header
+    for borrowing in borrowings:
+        line = (
+            f"• {escape(borrowing.user.email)} - "
+            f"{escape(borrowing.book.title)} "
+            f"(expected return: {borrowing.expected_return_date})\n"
+        )
+        if len(message) + len(line) > TELEGRAM_MESSAGE_LIMIT:
+            send_notification(message)
+            message = header
+        message += line
+    if message != header:
+        send_notification(message)
@@ -1,22 +1,41 @@
 import datetime
-from unittest import TestCase
 from unittest.mock import patch
 
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from telegram.error import RetryAfter, TelegramError
+
 from borrowings.models import Borrowing, Book
 from users.models import User
-from notifications.telegram import send_notification, borrowing_create_notification
+from notifications.models import Notification
+from notifications.rate_limit import TokenBucket
+from notifications.telegram import (
+    DRAIN_LOCK_KEY,
+    NOTIFICATION_ATTEMPTS,
+    send_notification,
+    borrowing_create_notification,
+    check_overdue_borrowings,
+    drain_notification_outbox,
+    send_overdue_digest,
+)
 
 
 class TelegramNotificationTest(TestCase):
-    @patch("notifications.telegram.bot.send_message")
-    def test_send_notification_success(self, mock_send):
-        send_notification("Test message")
-        mock_send.assert_called_once()
+    @patch("notifications.telegram.async_task")
+    def test_send_notification_queued(self, mock_async_task):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_notification("Test message", chat_id="42")
+        notification = Notification.objects.get()
 
-    @patch("notifications.telegram.bot.send_message", side_effect=Exception("Bot error"))
-    def test_send_notification_failure(self, mock_send):
-        send_notification("This will fail")
-        mock_send.assert_called_once()
+        self.assertEqual(notification.text, "Test message")
+        self.assertEqual(notification.chat_id, "42")
+        self.assertEqual(
+            notification.status, Notification.NotificationStatus.PENDING
+        )
+        mock_async_task.assert_called_once_with(
+            "notifications.telegram.drain_notification_outbox"
+        )
 
     @patch("notifications.telegram.send_notification")
     def test_borrowing_create_notification(self, mock_send_notification):
@@ -35,3 +54,217 @@ class TelegramNotificationTest(TestCase):
         self.assertIn("New borrowing created", message_arg)
         self.assertIn("test@example.com", message_arg)
         self.assertIn("Test Book", message_arg)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+@patch("notifications.rate_limit.time.sleep")
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def queue(self, text, chat_id="42"):
+        return Notification.objects.create(chat_id=chat_id, text=text)
+
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_sends_pending(self, mock_send, mock_sleep):
+        notification = self.queue("Test message")
+        drain_notification_outbox()
+        notification.refresh_from_db()
+
+        mock_send.assert_called_once_with(
+            chat_id="42", text="Test message", parse_mode="HTML"
+        )
+        self.assertEqual(
+            notification.status, Notification.NotificationStatus.SENT
+        )
+        self.assertIsNotNone(notification.sent_at)
+
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_coalesces_messages_per_chat(self, mock_send, mock_sleep):
+        self.queue("First")
+        self.queue("Second")
+        self.queue("Other chat", chat_id="7")
+        drain_notification_outbox()
+        texts = {
+            call.kwargs["chat_id"]: call.kwargs["text"]
+            for call in mock_send.call_args_list
+        }
+
+        self.assertEqual(mock_send.call_count, 2)
+        self.assertEqual(texts, {"42": "First\n\nSecond", "7": "Other chat"})
+
+    @patch("notifications.telegram.TELEGRAM_MESSAGE_LIMIT", 10)
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_respects_message_limit(self, mock_send, mock_sleep):
+        self.queue("First")
+        self.queue("Second")
+        drain_notification_outbox()
+        texts = [call.kwargs["text"] for call in mock_send.call_args_list]
+
+        self.assertEqual(texts, ["First", "Second"])
+        mock_sleep.assert_called()
+
+    @patch(
+        "notifications.telegram.bot.send_message",
+        side_effect=TelegramError("Bot error"),
+    )
+    def test_drain_reschedules_failed_delivery(self, mock_send, mock_sleep):
+        notification = self.queue("This will fail")
+        drain_notification_outbox()
+        notification.refresh_from_db()
+
+        mock_send.assert_called_once()
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(
+            notification.status, Notification.NotificationStatus.PENDING
+        )
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+    @patch(
+        "notifications.telegram.bot.send_message",
+        side_effect=TelegramError("Bot error"),
+    )
+    def test_drain_gives_up_after_max_attempts(self, mock_send, mock_sleep):
+        notification = self.queue("This will fail")
+        Notification.objects.filter(id=notification.id).update(
+            attempts=NOTIFICATION_ATTEMPTS - 1
+        )
+        drain_notification_outbox()
+        notification.refresh_from_db()
+
+        self.assertEqual(
+            notification.status, Notification.NotificationStatus.FAILED
+        )
+
+    @patch(
+        "notifications.telegram.bot.send_message",
+        side_effect=RetryAfter(15),
+    )
+    def test_drain_honours_retry_after(self, mock_send, mock_sleep):
+        notification = self.queue("Slow down")
+        drain_notification_outbox()
+        notification.refresh_from_db()
+
+        self.assertEqual(notification.attempts, 0)
+        self.assertGreater(
+            notification.next_attempt_at,
+            timezone.now() + datetime.timedelta(seconds=10),
+        )
+
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_releases_only_its_own_lock(self, mock_send, mock_sleep):
+        self.queue("Test message")
+        # The lock expires mid-drain and another worker takes it
+        mock_send.side_effect = lambda **kwargs: cache.set(
+            DRAIN_LOCK_KEY, "other worker"
+        )
+        drain_notification_outbox()
+
+        self.assertEqual(cache.get(DRAIN_LOCK_KEY), "other worker")
+
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_releases_lock(self, mock_send, mock_sleep):
+        self.queue("Test message")
+        drain_notification_outbox()
+
+        self.assertIsNone(cache.get(DRAIN_LOCK_KEY))
+
+    @patch("notifications.telegram.bot.send_message")
+    def test_drain_skipped_while_locked(self, mock_send, mock_sleep):
+        self.queue("Test message")
+        cache.add(DRAIN_LOCK_KEY, True)
+        drain_notification_outbox()
+
+        mock_send.assert_not_called()
+
+
+class TokenBucketTest(TestCase):
+    @patch("notifications.rate_limit.time")
+    def test_acquire_waits_for_refill(self, mock_time):
+        mock_time.monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=0.5, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+
+        mock_time.sleep.assert_not_called()
+
+        bucket.acquire()
+
+        mock_time.sleep.assert_called_once_with(2.0)
+
+
+class OverdueBorrowingsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="overdue@example.com")
+        cls.book = Book.objects.create(
+            title="Overdue Book", author="Author", inventory=10, daily_fee=1
+        )
+        cls.overdue_ids = []
+        for days in range(1, 6):
+            borrowing = Borrowing.objects.create(
+                expected_return_date=datetime.date.today(),
+                user=cls.user,
+                book=cls.book,
+            )
+            Borrowing.objects.filter(id=borrowing.id).update(
+                borrowing_date=datetime.date.today()
+                - datetime.timedelta(days=10),
+                expected_return_date=datetime.date.today()
+                - datetime.timedelta(days=days),
+            )
+            cls.overdue_ids.append(borrowing.id)
+        Borrowing.objects.create(
+            expected_return_date=datetime.date.today(),
+            user=cls.user,
+            book=cls.book,
+        )
+
+    @patch("notifications.telegram.OVERDUE_CHUNK_SIZE", 2)
+    @patch("notifications.telegram.async_task")
+    def test_overdue_scan_enqueues_chunks(self, mock_async_task):
+        check_overdue_borrowings()
+        chunks = [call.args[1] for call in mock_async_task.call_args_list]
+
+        self.assertEqual(
+            chunks,
+            [self.overdue_ids[:2], self.overdue_ids[2:4], self.overdue_ids[4:]],
+        )
+
+    @patch("notifications.telegram.send_notification")
+    @patch("notifications.telegram.async_task")
+    def test_no_overdue_borrowings(self, mock_async_task, mock_send):
+        Borrowing.objects.filter(id__in=self.overdue_ids).delete()
+        check_overdue_borrowings()
+
+        mock_async_task.assert_not_called()
+        self.assertIn("No borrowings overdue", mock_send.call_args[0][0])
+
+    @patch("notifications.telegram.send_notification")
+    def test_overdue_digest_grouped(self, mock_send):
+        with self.assertNumQueries(1):
+            send_overdue_digest(self.overdue_ids)
+
+        mock_send.assert_called_once()
+        message = mock_send.call_args[0][0]
+        self.assertEqual(message.count("overdue@example.com"), 5)
+        self.assertIn("Overdue Book", message)
+
+    @patch("notifications.telegram.TELEGRAM_MESSAGE_LIMIT", 200)
+    @patch("notifications.telegram.send_notification")
+    def test_overdue_digest_split_by_message_limit(self, mock_send):
+        send_overdue_digest(self.overdue_ids)
+        messages = [call.args[0] for call in mock_send.call_args_list]
+
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(message) <= 200 for message in messages))
+        self.assertEqual(
+            sum(message.count("overdue@example.com") for message in messages),
+            5,
+        )
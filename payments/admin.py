@@ -1,5 +1,15 @@
 from django.contrib import admin
 
-from payments.models import Payment
+from payments.models import (
+    FineAccrual,
+    FineAccrualWatermark,
+    FineBalance,
+    Payment,
+    StripeEvent,
+)
 
 admin.site.register(Payment)
+admin.site.register(StripeEvent)
+admin.site.register(FineAccrual)
+admin.site.register(FineBalance)
+admin.site.register(FineAccrualWatermark)
@@ -0,0 +1,121 @@
+import datetime
+import logging
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import (
+    FineAccrual,
+    FineAccrualWatermark,
+    FineBalance,
+    Payment,
+)
+
+FINE_MULTIPLIER = 2
+
+
+def accrue_fines(today: datetime.date | None = None) -> int:
+    """django-q task adding the fine days accrued since the last run
+
+    Every day after the watermark until today is written to the ledger
+    for each active overdue borrowing and the per-user balances are
+    bumped, in a single statement. Days already accrued are skipped, so
+    a rerun on the same day does nothing.
+    """
+    today = today or datetime.date.today()
+    balance_table = FineBalance._meta.db_table
+    with transaction.atomic():
+        watermark = (
+            FineAccrualWatermark.objects.select_for_update()
+            .order_by("id")
+            .first()
+        )
+        if watermark and watermark.processed_through >= today:
+            return 0
+        start = (
+            watermark.processed_through + datetime.timedelta(days=1)
+            if watermark
+            else datetime.date.min
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH accrued AS (
+                    INSERT INTO {FineAccrual._meta.db_table}
+                        (borrowing_id, user_id, date, amount)
+                    SELECT borrowing.id, borrowing.user_id, day::date,
+                           book.daily_fee * %(multiplier)s
+                    FROM {Borrowing._meta.db_table} borrowing
+                    JOIN {Book._meta.db_table} book
+                        ON book.id = borrowing.book_id
+                    CROSS JOIN LATERAL generate_series(
+                        GREATEST(
+                            borrowing.expected_return_date + 1,
+                            %(start)s::date
+                        ),
+                        %(today)s::date,
+                        interval '1 day'
+                    ) day
+                    WHERE borrowing.actual_return_date IS NULL
+                        AND borrowing.expected_return_date < %(today)s
+                    ON CONFLICT (borrowing_id, date) DO NOTHING
+                    RETURNING user_id, amount
+                ),
+                balances AS (
+                    INSERT INTO {balance_table}
+                        (user_id, outstanding, updated_at)
+                    SELECT user_id, SUM(amount), %(now)s
+                    FROM accrued
+                    GROUP BY user_id
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        outstanding = {balance_table}.outstanding
+                            + EXCLUDED.outstanding,
+                        updated_at = EXCLUDED.updated_at
+                )
+                SELECT COUNT(*) FROM accrued
+                """,
+                {
+                    "multiplier": FINE_MULTIPLIER,
+                    "start": start,
+                    "today": today,
+                    "now": timezone.now(),
+                },
+            )
+            accrued_days = cursor.fetchone()[0]
+
+        if watermark:
+            watermark.processed_through = today
+            watermark.save(update_fields=["processed_through"])
+        else:
+            FineAccrualWatermark.objects.create(processed_through=today)
+
+    logging.info(f"Accrued {accrued_days} fine day(s) through {today}")
+    return accrued_days
+
+
+def settle_fines(payments: list[Payment]):
+    """Take the accrued fines of paid fine payments off user balances"""
+    borrowing_ids = [
+        payment.borrowing_id
+        for payment in payments
+        if payment.type == Payment.TransactionType.FINE
+    ]
+    settled = (
+        FineAccrual.objects.filter(borrowing_id__in=borrowing_ids)
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+    )
+    for row in settled:
+        FineBalance.objects.filter(user_id=row["user_id"]).update(
+            outstanding=F("outstanding") - row["total"]
+        )
+
+
+def get_outstanding_fines(user_id: int) -> Decimal:
+    balance = FineBalance.objects.filter(user_id=user_id).first()
+    return balance.outstanding if balance else Decimal("0.00")
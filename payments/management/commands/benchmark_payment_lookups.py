@@ -0,0 +1,109 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import Payment
+
+LOOKUP_INDEXES = (
+    "payment_unique_session_borrowing",
+    "payment_borrow_type_status_idx",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed payments and time the session_id and fine lookups with and "
+        "without their indexes. Everything runs in one transaction that "
+        "is rolled back, but it locks the payments table meanwhile, so "
+        "only run it against a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payments", type=int, default=10_000_000)
+        parser.add_argument("--lookups", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_id = self._seed(options["payments"])
+            borrowing_ids = list(
+                Borrowing.objects.filter(user_id=user_id)
+                .order_by("?")
+                .values_list("id", flat=True)[: options["lookups"]]
+            )
+
+            self._report("indexed", borrowing_ids)
+            with connection.cursor() as cursor:
+                for index in LOOKUP_INDEXES:
+                    cursor.execute(f'DROP INDEX "{index}"')
+            self._report("unindexed", borrowing_ids)
+
+            transaction.set_rollback(True)
+
+    def _seed(self, payments):
+        user = get_user_model().objects.create(
+            email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        book = Book.objects.create(
+            title="Benchmark book",
+            author="Benchmark author",
+            inventory=0,
+            daily_fee=1,
+        )
+        borrowing_table = Borrowing._meta.db_table
+        payment_table = Payment._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {borrowing_table} "
+                f"(borrowing_date, expected_return_date, user_id, book_id) "
+                f"SELECT CURRENT_DATE, CURRENT_DATE + 7, %s, %s "
+                f"FROM generate_series(1, %s)",
+                [user.id, book.id, max(payments // 2, 1)],
+            )
+            cursor.execute(
+                f"INSERT INTO {payment_table} "
+                f"(status, type, borrowing_id, session_url, session_id, "
+                f"money_to_pay) "
+                f"SELECT "
+                f"CASE WHEN b.id %% 3 = 0 THEN 'PAID' ELSE 'PENDING' END, "
+                f"CASE WHEN k = 1 THEN 'PAYMENT' ELSE 'FINE' END, "
+                f"b.id, 'https://checkout.stripe.com/' || b.id || '_' || k, "
+                f"'cs_bench_' || b.id || '_' || k, 10 "
+                f"FROM {borrowing_table} b CROSS JOIN generate_series(1, 2) k "
+                f"WHERE b.user_id = %s",
+                [user.id],
+            )
+            cursor.execute(f"ANALYZE {borrowing_table}")
+            cursor.execute(f"ANALYZE {payment_table}")
+            cursor.execute(f"SELECT count(*) FROM {payment_table}")
+            self.stdout.write(f"Payments in table: {cursor.fetchone()[0]}")
+
+        return user.id
+
+    def _report(self, label, borrowing_ids):
+        start = time.perf_counter()
+        for borrowing_id in borrowing_ids:
+            Payment.objects.get(session_id=f"cs_bench_{borrowing_id}_1")
+        session_ms = self._average_ms(start, borrowing_ids)
+
+        start = time.perf_counter()
+        for borrowing_id in borrowing_ids:
+            Payment.objects.filter(
+                borrowing_id=borrowing_id,
+                type=Payment.TransactionType.FINE,
+            ).first()
+        fine_ms = self._average_ms(start, borrowing_ids)
+
+        self.stdout.write(
+            f"{label}: session_id lookup {session_ms:.2f} ms, "
+            f"fine lookup {fine_ms:.2f} ms"
+        )
+
+    @staticmethod
+    def _average_ms(start, borrowing_ids):
+        return (time.perf_counter() - start) * 1000 / len(borrowing_ids)
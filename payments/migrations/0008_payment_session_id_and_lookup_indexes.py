@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 06:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the payments table stays writable
+    # during the rollout, which requires running outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0001_initial"),
+        ("payments", "0007_stripeevent"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["borrowing", "type", "status"],
+                name="payment_borrow_type_status_idx",
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        "CREATE UNIQUE INDEX CONCURRENTLY "
+                        '"payment_unique_session_id" '
+                        'ON "payments_payment" ("session_id") '
+                        "WHERE NOT (\"session_id\" = '')"
+                    ),
+                    reverse_sql=(
+                        "DROP INDEX CONCURRENTLY "
+                        'IF EXISTS "payment_unique_session_id"'
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="payment",
+                    constraint=models.UniqueConstraint(
+                        condition=models.Q(("session_id", ""), _negated=True),
+                        fields=("session_id",),
+                        name="payment_unique_session_id",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 06:39
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The plain index is built before the unique one is dropped so session
+    # lookups never lose their index, both concurrently and outside a
+    # transaction as in 0008.
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0002_borrowing_active_partial_indexes"),
+        ("payments", "0008_payment_session_id_and_lookup_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("session_id", ""), _negated=True),
+                fields=["session_id"],
+                name="payment_session_id_idx",
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        "DROP INDEX CONCURRENTLY "
+                        'IF EXISTS "payment_unique_session_id"'
+                    ),
+                    reverse_sql=(
+                        "CREATE UNIQUE INDEX CONCURRENTLY "
+                        '"payment_unique_session_id" '
+                        'ON "payments_payment" ("session_id") '
+                        "WHERE NOT (\"session_id\" = '')"
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name="payment",
+                    name="payment_unique_session_id",
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0009_shared_session_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PAID", "Paid"),
+                    ("EXPIRED", "Expired"),
+                ],
+                default="PENDING",
+                max_length=7,
+            ),
+        ),
+    ]
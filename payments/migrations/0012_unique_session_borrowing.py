@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 07:41
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The unique index is built before the plain one is dropped so session
+    # lookups never lose their index, both concurrently and outside a
+    # transaction as in 0009.
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0005_borrowing_version"),
+        ("payments", "0011_fine_accrual_ledger"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        "CREATE UNIQUE INDEX CONCURRENTLY "
+                        '"payment_unique_session_borrowing" '
+                        'ON "payments_payment" ("session_id", "borrowing_id") '
+                        "WHERE NOT (\"session_id\" = '')"
+                    ),
+                    reverse_sql=(
+                        "DROP INDEX CONCURRENTLY "
+                        'IF EXISTS "payment_unique_session_borrowing"'
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="payment",
+                    constraint=models.UniqueConstraint(
+                        condition=models.Q(("session_id", ""), _negated=True),
+                        fields=("session_id", "borrowing"),
+                        name="payment_unique_session_borrowing",
+                    ),
+                ),
+            ],
+        ),
+        RemoveIndexConcurrently(
+            model_name="payment",
+            name="payment_session_id_idx",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0012_unique_session_borrowing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
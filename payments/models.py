@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 
 from borrowings.models import Borrowing
 
@@ -7,6 +9,7 @@ class Payment(models.Model):
     class PaymentStatus(models.TextChoices):
         PENDING = "PENDING", "Pending"
         PAID = "PAID", "Paid"
+        EXPIRED = "EXPIRED", "Expired"
 
     class TransactionType(models.TextChoices):
         PAYMENT = "PAYMENT", "Payment"
@@ -19,10 +22,92 @@ class Payment(models.Model):
     borrowing = models.ForeignKey(
         Borrowing, on_delete=models.CASCADE, related_name="payments"
     )
-    session_url = models.URLField(max_length=510)
-    session_id = models.CharField(max_length=255)
+    session_url = models.URLField(max_length=510, blank=True)
+    session_id = models.CharField(max_length=255, blank=True)
+    session_expires_at = models.DateTimeField(null=True, blank=True)
+    # Set while a request is replacing the session outside the row lock
+    session_claimed_at = models.DateTimeField(null=True, blank=True)
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["borrowing", "type", "status"],
+                name="payment_borrow_type_status_idx",
+            ),
+        ]
+        constraints = [
+            # A multi-book checkout shares one session across its payments,
+            # but never pays for the same borrowing twice. Its index also
+            # serves the session_id lookups.
+            models.UniqueConstraint(
+                fields=["session_id", "borrowing"],
+                condition=~Q(session_id=""),
+                name="payment_unique_session_borrowing",
+            ),
+        ]
+
     def __str__(self):
         return (f"{self.borrowing.user.email} - "
                 f"{self.money_to_pay}$ - {self.status}")
+
+
+class StripeEvent(models.Model):
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} - {self.event_id}"
+
+
+class FineAccrual(models.Model):
+    """One day of fine accrued by an overdue borrowing"""
+
+    borrowing = models.ForeignKey(
+        Borrowing, on_delete=models.CASCADE, related_name="fine_accruals"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="fine_accruals",
+    )
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["borrowing", "date"], name="fine_accrual_unique_day"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.borrowing_id} - {self.date} - {self.amount}$"
+
+
+class FineBalance(models.Model):
+    """Fines accrued by a user and not paid yet"""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="fine_balance",
+    )
+    outstanding = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.outstanding}$"
+
+
+class FineAccrualWatermark(models.Model):
+    """Last day the fine accrual job has processed"""
+
+    processed_through = models.DateField()
+
+    def __str__(self):
+        return str(self.processed_through)
@@ -1,10 +1,13 @@
 from rest_framework import serializers
 
 from borrowings.serializers import BorrowingListSerializer
+from library_service.fieldsets import SparseFieldsetSerializerMixin
 from payments.models import Payment
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Payment
         fields = (
@@ -18,7 +21,11 @@ class PaymentSerializer(serializers.ModelSerializer):
         )
 
 
-class PaymentListSerializer(serializers.ModelSerializer):
+class PaymentListSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
+    expandable_fields = {"borrowing": BorrowingListSerializer}
+
     class Meta:
         model = Payment
         fields = (
@@ -1,59 +1,442 @@
+import datetime
+import logging
 from decimal import Decimal
 
 import stripe
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
 from django.http import HttpRequest
+from django.utils import timezone
 from rest_framework.reverse import reverse
 
 from borrowings.models import Borrowing
+from payments.fines import FINE_MULTIPLIER, settle_fines
 from payments.models import Payment
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+# Sessions closer than this to expiry are replaced rather than handed out
+CHECKOUT_SESSION_MIN_LIFETIME = datetime.timedelta(minutes=10)
+# Stripe sessions expire at most 24 hours after they are created
+CHECKOUT_SESSION_MAX_LIFETIME = datetime.timedelta(hours=24)
+# A claim older than this is from a request that died while calling Stripe
+CHECKOUT_SESSION_CLAIM_TIMEOUT = datetime.timedelta(minutes=2)
+RECONCILIATION_CHUNK_SIZE = 500
 
-def create_checkout_session(borrowing, transaction_type, request: HttpRequest):
-    amount = _calculate_amount(borrowing, transaction_type)
+
+def create_payment(borrowing: Borrowing, transaction_type) -> Payment:
+    """Create a pending payment whose Stripe session is opened later"""
+    payment = Payment.objects.create(
+        status=Payment.PaymentStatus.PENDING,
+        type=transaction_type,
+        borrowing=borrowing,
+        money_to_pay=_calculate_amount(borrowing, transaction_type),
+    )
+    Borrowing.bump_versions([borrowing.id])
+    return payment
+
+
+def create_payments(
+    borrowings: list[Borrowing], transaction_type
+) -> list[Payment]:
+    """Create the pending payments of several borrowings in one INSERT"""
+    payments = Payment.objects.bulk_create(
+        Payment(
+            status=Payment.PaymentStatus.PENDING,
+            type=transaction_type,
+            borrowing=borrowing,
+            money_to_pay=_calculate_amount(borrowing, transaction_type),
+        )
+        for borrowing in borrowings
+    )
+    Borrowing.bump_versions([borrowing.id for borrowing in borrowings])
+    return payments
+
+
+def get_checkout_urls(request: HttpRequest) -> tuple[str, str]:
     success_url = (
         request.build_absolute_uri(reverse("payments:payment-success"))
         + "?session_id={CHECKOUT_SESSION_ID}"
     )
     cancel_url = request.build_absolute_uri(reverse("payments:payment-cancel"))
+    return success_url, cancel_url
+
+
+def create_checkout_session(
+    payment: Payment, success_url: str, cancel_url: str
+) -> str:
+    return create_batch_checkout_session([payment], success_url, cancel_url)
+
+
+def create_batch_checkout_session(
+    payments: list[Payment], success_url: str, cancel_url: str
+) -> str:
+    """Open one Stripe session with a line item per payment"""
+    session = _open_checkout_session(payments, success_url, cancel_url)
+    for payment in payments:
+        _apply_session(payment, session)
+    Payment.objects.filter(
+        pk__in=[payment.pk for payment in payments]
+    ).update(
+        session_url=payments[0].session_url,
+        session_id=payments[0].session_id,
+        session_expires_at=payments[0].session_expires_at,
+    )
+    Borrowing.bump_versions([payment.borrowing_id for payment in payments])
+    return session.url
+
+
+def get_or_create_checkout_session(
+    borrowing: Borrowing, transaction_type, success_url: str, cancel_url: str
+) -> tuple[Payment, bool]:
+    """Hand out the open session of a pending payment or open a new one
+
+    The newest pending payment keeps its session while it is unexpired
+    and its amount is still due; otherwise the session is expired on
+    Stripe and the row gets a fresh one. Older pending payments are
+    expired. Returns the payment and whether its row was created.
+
+    Rows are locked only to claim the payment and to save the outcome.
+    Stripe is called in between, and the claim makes concurrent callers
+    get the payment back instead of opening a second session.
+    """
+    amount = _calculate_amount(borrowing, transaction_type)
+    with transaction.atomic():
+        pending = list(
+            Payment.objects.select_for_update()
+            .filter(
+                borrowing=borrowing,
+                type=transaction_type,
+                status=Payment.PaymentStatus.PENDING,
+            )
+            .order_by("-id")
+        )
+        payment = pending[0] if pending else None
+        if payment is not None and _is_claimed(payment):
+            return payment, False
+        reusable = payment is not None and _is_reusable(payment, amount)
+        if reusable and len(pending) == 1:
+            return payment, False
+
+        created = payment is None
+        if created:
+            payment = Payment(
+                status=Payment.PaymentStatus.PENDING,
+                type=transaction_type,
+                borrowing=borrowing,
+                money_to_pay=amount,
+            )
+        old_session_url = payment.session_url
+        if not reusable:
+            # Not handed out to concurrent callers while it is replaced
+            payment.session_url = ""
+        payment.session_claimed_at = timezone.now()
+        payment.save()
+        Borrowing.bump_versions([borrowing.id])
+
     try:
-        session = stripe.checkout.Session.create(
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "product_data": {
-                            "name": f"{transaction_type} for "
-                                    f"{borrowing.book.title}",
-                        },
-                        "unit_amount": int(amount * 100),
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url=success_url,
-            cancel_url=cancel_url,
-            metadata={
-                "borrowing_id": borrowing.id,
-                "transaction_type": transaction_type,
-            },
+        for old_payment in pending[1:] if reusable else pending:
+            if not _expire_session(old_payment):
+                # Paid meanwhile, the webhook will complete this payment
+                payment.session_url = old_session_url
+                _release_claim(payment)
+                return old_payment, False
+        if not reusable:
+            payment.money_to_pay = amount
+            payment.borrowing = borrowing
+            session = _open_checkout_session(
+                [payment], success_url, cancel_url
+            )
+    except Exception:
+        if created:
+            payment.delete()
+            Borrowing.bump_versions([borrowing.id])
+        else:
+            payment.session_url = old_session_url
+            _release_claim(payment)
+        raise
+
+    with transaction.atomic():
+        Payment.objects.filter(
+            pk__in=[old_payment.pk for old_payment in pending[1:]],
+            status=Payment.PaymentStatus.PENDING,
+        ).update(status=Payment.PaymentStatus.EXPIRED)
+        if reusable:
+            _release_claim(payment)
+        else:
+            _apply_session(payment, session)
+            # Reconciliation may have expired the row with its old session
+            payment.status = Payment.PaymentStatus.PENDING
+            _release_claim(
+                payment,
+                "status",
+                "money_to_pay",
+                "session_id",
+                "session_expires_at",
+            )
+
+    return payment, created
+
+
+def create_checkout_session_task(
+    payment_id: int, success_url: str, cancel_url: str
+) -> str:
+    """django-q task opening the Stripe session of a committed payment"""
+    payment = Payment.objects.select_related("borrowing__book").get(
+        pk=payment_id
+    )
+    if payment.session_id:
+        return payment.session_url
+
+    try:
+        return create_checkout_session(payment, success_url, cancel_url)
+    except stripe.error.StripeError as e:
+        logging.error(
+            f"Failed to create checkout session for payment {payment_id}: {e}"
         )
-    except Exception as e:
-        return str(e)
+        raise
 
-    Payment.objects.create(
-        status=Payment.PaymentStatus.PENDING,
-        type=transaction_type,
-        borrowing=borrowing,
-        session_url=session.url,
-        session_id=session.id,
-        money_to_pay=amount,
+
+def create_batch_checkout_session_task(
+    payment_ids: list[int], success_url: str, cancel_url: str
+) -> str:
+    """django-q task opening one Stripe session for a multi-book checkout"""
+    payments = list(
+        Payment.objects.select_related("borrowing__book")
+        .filter(pk__in=payment_ids)
+        .order_by("id")
     )
+    if payments[0].session_id:
+        return payments[0].session_url
 
-    return session.url
+    try:
+        return create_batch_checkout_session(
+            payments, success_url, cancel_url
+        )
+    except stripe.error.StripeError as e:
+        logging.error(
+            f"Failed to create checkout session for payments "
+            f"{payment_ids}: {e}"
+        )
+        raise
+
+
+def complete_checkout_session(session_id: str):
+    """django-q task marking the payments of a paid Stripe session as paid"""
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .select_related("borrowing__book")
+            .filter(session_id=session_id)
+            .order_by("id")
+        )
+        if not payments:
+            raise Payment.DoesNotExist(f"No payment for session {session_id}")
+
+        _mark_paid(
+            [
+                payment
+                for payment in payments
+                if payment.status != Payment.PaymentStatus.PAID
+            ]
+        )
+
+
+def reconcile_pending_payments() -> dict[str, int]:
+    """django-q task settling pending payments whose webhook never came
+
+    Outcomes of every session that could belong to a pending payment are
+    fetched with a few paginated Stripe list calls, then pending payments
+    are walked in id order and updated a chunk at a time. Sessions opened
+    before their expiry was stored have no window to list them in and are
+    retrieved one by one; they are long finished, so each is looked up
+    only once before its payment leaves the pending state.
+    """
+    pending = Payment.objects.filter(
+        status=Payment.PaymentStatus.PENDING
+    ).exclude(session_id="")
+    oldest_expiry = pending.aggregate(oldest=Min("session_expires_at"))[
+        "oldest"
+    ]
+    legacy_session_ids = list(
+        pending.filter(session_expires_at__isnull=True)
+        .values_list("session_id", flat=True)
+        .distinct()
+    )
+    if oldest_expiry is None and not legacy_session_ids:
+        return {"paid": 0, "expired": 0}
+
+    outcomes = _retrieve_session_outcomes(legacy_session_ids)
+    if oldest_expiry is not None:
+        outcomes.update(
+            _fetch_session_outcomes(
+                since=oldest_expiry - CHECKOUT_SESSION_MAX_LIFETIME
+            )
+        )
+    counts = {"paid": 0, "expired": 0}
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            payments = list(
+                pending.select_for_update(skip_locked=True, of=("self",))
+                .select_related("borrowing__book")
+                .filter(id__gt=last_id)
+                .order_by("id")[:RECONCILIATION_CHUNK_SIZE]
+            )
+            if not payments:
+                break
+            last_id = payments[-1].id
+
+            paid = []
+            expired = []
+            for payment in payments:
+                outcome = outcomes.get(payment.session_id)
+                if outcome == Payment.PaymentStatus.PAID:
+                    paid.append(payment)
+                elif outcome == Payment.PaymentStatus.EXPIRED:
+                    payment.status = Payment.PaymentStatus.EXPIRED
+                    expired.append(payment)
+            _mark_paid(paid)
+            Payment.objects.bulk_update(expired, ["status"])
+            Borrowing.bump_versions(
+                [payment.borrowing_id for payment in expired]
+            )
+
+        counts["paid"] += len(paid)
+        counts["expired"] += len(expired)
+
+    logging.info(
+        f"Reconciled pending payments: {counts['paid']} paid, "
+        f"{counts['expired']} expired"
+    )
+    return counts
+
+
+def _fetch_session_outcomes(since: datetime.datetime) -> dict[str, str]:
+    """Map ids of finished Stripe sessions created since to a status"""
+    outcomes = {}
+    for session_status in ("complete", "expired"):
+        sessions = stripe.checkout.Session.list(
+            status=session_status,
+            created={"gte": int(since.timestamp())},
+            limit=100,
+        )
+        for session in sessions.auto_paging_iter():
+            outcome = _get_session_outcome(session)
+            if outcome is not None:
+                outcomes[session.id] = outcome
+    return outcomes
+
+
+def _retrieve_session_outcomes(session_ids: list[str]) -> dict[str, str]:
+    """Map ids of finished Stripe sessions to a status, one call each"""
+    outcomes = {}
+    for session_id in session_ids:
+        try:
+            session = stripe.checkout.Session.retrieve(session_id)
+        except stripe.error.InvalidRequestError as e:
+            logging.warning(f"Cannot retrieve session {session_id}: {e}")
+            continue
+        outcome = _get_session_outcome(session)
+        if outcome is not None:
+            outcomes[session_id] = outcome
+    return outcomes
+
+
+def _get_session_outcome(session) -> str | None:
+    if session.status == "expired":
+        return Payment.PaymentStatus.EXPIRED
+    if session.status == "complete" and session.payment_status == "paid":
+        return Payment.PaymentStatus.PAID
+    return None
+
+
+def _mark_paid(payments: list[Payment]):
+    for payment in payments:
+        payment.status = Payment.PaymentStatus.PAID
+    Payment.objects.bulk_update(payments, ["status"])
+    Borrowing.bump_versions([payment.borrowing_id for payment in payments])
+    settle_fines(payments)
+    for payment in payments:
+        if payment.type == Payment.TransactionType.FINE:
+            payment.borrowing.return_borrowing()
+
+
+def _is_reusable(payment: Payment, amount: Decimal) -> bool:
+    return (
+        bool(payment.session_id)
+        and payment.money_to_pay == amount
+        and payment.session_expires_at is not None
+        and payment.session_expires_at
+        > timezone.now() + CHECKOUT_SESSION_MIN_LIFETIME
+    )
+
+
+def _open_checkout_session(
+    payments: list[Payment], success_url: str, cancel_url: str
+):
+    return stripe.checkout.Session.create(
+        line_items=[
+            {
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {
+                        "name": f"{payment.type} for "
+                                f"{payment.borrowing.book.title}",
+                    },
+                    "unit_amount": int(payment.money_to_pay * 100),
+                },
+                "quantity": 1,
+            }
+            for payment in payments
+        ],
+        mode="payment",
+        success_url=success_url,
+        cancel_url=cancel_url,
+        metadata={
+            "borrowing_id": ",".join(
+                str(payment.borrowing_id) for payment in payments
+            ),
+            "transaction_type": payments[0].type,
+        },
+    )
+
+
+def _apply_session(payment: Payment, session):
+    payment.session_url = session.url
+    payment.session_id = session.id
+    payment.session_expires_at = datetime.datetime.fromtimestamp(
+        session.expires_at, tz=datetime.timezone.utc
+    )
+
+
+def _is_claimed(payment: Payment) -> bool:
+    return (
+        payment.session_claimed_at is not None
+        and payment.session_claimed_at
+        > timezone.now() - CHECKOUT_SESSION_CLAIM_TIMEOUT
+    )
+
+
+def _release_claim(payment: Payment, *update_fields: str):
+    payment.session_claimed_at = None
+    payment.save(
+        update_fields=["session_claimed_at", "session_url", *update_fields]
+    )
+    Borrowing.bump_versions([payment.borrowing_id])
+
+
+def _expire_session(payment: Payment) -> bool:
+    """Make sure the session of a pending payment can no longer be paid"""
+    if not payment.session_id:
+        return True
+    try:
+        session = stripe.checkout.Session.expire(payment.session_id)
+    except stripe.error.InvalidRequestError:
+        # Only open sessions can be expired, check why this one is not
+        session = stripe.checkout.Session.retrieve(payment.session_id)
+    return session.status == "expired"
 
 
 def _calculate_amount(borrowing: Borrowing, transaction_type) -> Decimal:
@@ -61,9 +444,7 @@ def _calculate_amount(borrowing: Borrowing, transaction_type) -> Decimal:
         price = Decimal(borrowing.book.daily_fee)
         return price * max(borrowing.get_duration_days(), 1)
     elif transaction_type == Payment.TransactionType.FINE:
-        price = (
-            Decimal(borrowing.book.daily_fee) * 2
-        )  # later maybe need to move multiplier into variable
+        price = Decimal(borrowing.book.daily_fee) * FINE_MULTIPLIER
         return price * borrowing.get_overdue_days()
     else:
         raise ValueError(f"Invalid transaction type: {transaction_type}")
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import stripe
+
+
+class StripeSessionStub:
+    """In-memory stand-in for stripe.checkout.Session list calls
+
+    Pages are served page_size sessions at a time and every page counts
+    as one API request, like auto-pagination against the real API.
+    Retrieved sessions are counted apart in retrievals.
+    """
+
+    def __init__(self, sessions, page_size=100):
+        self.sessions = [SimpleNamespace(**session) for session in sessions]
+        self.page_size = page_size
+        self.requests = 0
+        self.retrievals = []
+
+    def list(self, status=None, created=None, limit=10):
+        sessions = [
+            session
+            for session in self.sessions
+            if (status is None or session.status == status)
+            and (created is None or session.created >= created["gte"])
+        ]
+        return SimpleNamespace(
+            auto_paging_iter=lambda: self._paginate(sessions)
+        )
+
+    def retrieve(self, session_id):
+        self.retrievals.append(session_id)
+        for session in self.sessions:
+            if session.id == session_id:
+                return session
+        raise stripe.error.InvalidRequestError(
+            f"No such checkout.session: '{session_id}'", "session"
+        )
+
+    def _paginate(self, sessions):
+        for start in range(0, max(len(sessions), 1), self.page_size):
+            self.requests += 1
+            yield from sessions[start:start + self.page_size]
@@ -0,0 +1,152 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.fines import accrue_fines
+from payments.models import FineAccrual, FineBalance, Payment
+from payments.services import _calculate_amount, complete_checkout_session
+
+BALANCE_URL = reverse("payments:payment-balance")
+
+
+def overdue_borrowing_sample(user, book, days):
+    today = datetime.date.today()
+    borrowing = Borrowing.objects.create(
+        expected_return_date=today, user=user, book=book
+    )
+    Borrowing.objects.filter(id=borrowing.id).update(
+        borrowing_date=today - datetime.timedelta(days=days + 1),
+        expected_return_date=today - datetime.timedelta(days=days),
+    )
+    borrowing.refresh_from_db()
+    return borrowing
+
+
+class FineAccrualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.book = Book.objects.create(
+            title="Book_1", author="Author_1", inventory=10, daily_fee=0.50
+        )
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+
+    def get_outstanding(self):
+        return FineBalance.objects.get(user=self.test_user).outstanding
+
+    def test_fines_accrued_up_to_today(self):
+        borrowing = overdue_borrowing_sample(self.test_user, self.book, 3)
+        Borrowing.objects.create(
+            expected_return_date=self.today + datetime.timedelta(days=3),
+            user=self.test_user,
+            book=self.book,
+        )
+
+        accrued_days = accrue_fines(self.today)
+
+        self.assertEqual(accrued_days, 3)
+        self.assertEqual(
+            self.get_outstanding(),
+            _calculate_amount(borrowing, Payment.TransactionType.FINE),
+        )
+
+    def test_rerun_on_same_day_is_noop(self):
+        overdue_borrowing_sample(self.test_user, self.book, 3)
+        accrue_fines(self.today)
+
+        accrued_days = accrue_fines(self.today)
+
+        self.assertEqual(accrued_days, 0)
+        self.assertEqual(FineAccrual.objects.count(), 3)
+        self.assertEqual(self.get_outstanding(), Decimal("3.00"))
+
+    def test_next_run_accrues_only_new_days(self):
+        overdue_borrowing_sample(self.test_user, self.book, 3)
+        accrue_fines(self.yesterday)
+
+        accrued_days = accrue_fines(self.today)
+
+        self.assertEqual(accrued_days, 1)
+        self.assertEqual(self.get_outstanding(), Decimal("3.00"))
+
+    def test_returned_borrowings_not_accrued(self):
+        borrowing = overdue_borrowing_sample(self.test_user, self.book, 3)
+        Borrowing.objects.filter(id=borrowing.id).update(
+            actual_return_date=self.today
+        )
+
+        self.assertEqual(accrue_fines(self.today), 0)
+        self.assertFalse(FineBalance.objects.exists())
+
+    def test_paid_fine_settles_balance(self):
+        borrowing = overdue_borrowing_sample(self.test_user, self.book, 3)
+        accrue_fines(self.today)
+        Payment.objects.create(
+            type=Payment.TransactionType.FINE,
+            borrowing=borrowing,
+            session_url="https://example.com",
+            session_id="cs_test_fine",
+            money_to_pay=3,
+        )
+
+        complete_checkout_session("cs_test_fine")
+
+        self.assertEqual(self.get_outstanding(), Decimal("0.00"))
+
+
+class FineBalanceAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.test_admin = get_user_model().objects.create(
+            email="admin@test.com", password="1qazcde3", is_staff=True
+        )
+        FineBalance.objects.create(user=cls.test_user, outstanding=4)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_own_balance(self):
+        self.client.force_authenticate(user=self.test_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["outstanding"], Decimal("4.00"))
+
+    def test_user_cannot_read_other_balance(self):
+        self.client.force_authenticate(user=self.test_user)
+        response = self.client.get(
+            BALANCE_URL, data={"user_id": self.test_admin.id}
+        )
+
+        self.assertEqual(response.data["user"], self.test_user.id)
+
+    def test_staff_reads_user_balance(self):
+        self.client.force_authenticate(user=self.test_admin)
+        response = self.client.get(
+            BALANCE_URL, data={"user_id": self.test_user.id}
+        )
+
+        self.assertEqual(response.data["outstanding"], Decimal("4.00"))
+
+    def test_balance_without_fines(self):
+        self.client.force_authenticate(user=self.test_admin)
+        response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(response.data["outstanding"], Decimal("0.00"))
@@ -1,8 +1,16 @@
 import datetime
+import hashlib
+import hmac
+import json
+import time
 from unittest.mock import patch, MagicMock
 
+import stripe
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection, IntegrityError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
@@ -11,9 +19,19 @@ from books.models import Book
 from borrowings.models import Borrowing
 
 from payments.models import Payment
+from payments.services import (
+    complete_checkout_session,
+    create_batch_checkout_session_task,
+    create_checkout_session_task,
+    get_or_create_checkout_session,
+    reconcile_pending_payments,
+)
 from payments.serializers import PaymentListSerializer, PaymentDetailSerializer
+from payments.tests.stripe_stub import StripeSessionStub
 
 PAYMENT_URL = reverse("payments:payment-list")
+WEBHOOK_URL = reverse("payments:payment-webhook")
+WEBHOOK_SECRET = "whsec_test_secret"
 
 
 def get_detail_url(payment_id):
@@ -35,6 +53,17 @@ def return_day_sample():
     return datetime.date.today() + datetime.timedelta(days=5)
 
 
+def session_sample(session_id, **params):
+    defaults = {
+        "id": session_id,
+        "url": f"https://checkout.stripe.com/{session_id}",
+        "status": "open",
+        "expires_at": int(time.time()) + 24 * 60 * 60,
+    }
+    defaults.update(params)
+    return MagicMock(**defaults)
+
+
 class PaymentsAPITestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -120,8 +149,43 @@ class AuthorizedUserTests(PaymentsAPITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
-    @patch("payments.views.stripe.checkout.Session.retrieve")
-    def test_payment_success(self, mock_retrieve):
+    def test_payments_list_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(PAYMENT_URL, {"fields": "id,status"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [{"id": self.payment_1.id, "status": self.payment_1.status}],
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("money_to_pay", queries[0]["sql"])
+
+    def test_payments_list_expand_borrowing(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(PAYMENT_URL, {"expand": "borrowing"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data[0]["borrowing"]["id"], self.payment_1.borrowing_id
+        )
+
+    def test_payment_detail_without_borrowing(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                get_detail_url(self.payment_1.id),
+                {"fields": "id,money_to_pay"},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"id", "money_to_pay"})
+
+    def test_payments_list_unknown_field(self):
+        response = self.client.get(PAYMENT_URL, {"fields": "id,secret"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_payment_success(self):
         book = book_sample()
         borrowing = Borrowing.objects.create(
             expected_return_date=return_day_sample(),
@@ -136,12 +200,6 @@ class AuthorizedUserTests(PaymentsAPITestCase):
             session_id="cs_test_session_id",
             money_to_pay=10,
         )
-        mock_session = MagicMock()
-        mock_session.__getitem__.side_effect = lambda key: {
-            "metadata": {"transaction_type": "PAYMENT"}
-        }[key]
-        mock_session.payment_status = "paid"
-        mock_retrieve.return_value = mock_session
 
         url_with_out_session_id = PAYMENT_URL + "success/"
         response = self.client.get(url_with_out_session_id)
@@ -152,11 +210,23 @@ class AuthorizedUserTests(PaymentsAPITestCase):
             PAYMENT_URL + f"success/?session_id={payment.session_id}"
         )
         response = self.client.get(url_with_session_id)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        complete_checkout_session(payment.session_id)
+        response = self.client.get(url_with_session_id)
         updated_payment = Payment.objects.get(id=payment.id)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(updated_payment.status, Payment.PaymentStatus.PAID)
 
+    def test_payment_success_unknown_session(self):
+        response = self.client.get(
+            PAYMENT_URL + "success/?session_id=cs_test_unknown"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class AdminUserTests(PaymentsAPITestCase):
     def setUp(self):
@@ -171,3 +241,570 @@ class AdminUserTests(PaymentsAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(payments.count(), len(serializer.data))
+
+
+class CheckoutSessionTaskTests(PaymentsAPITestCase):
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_task_opens_session_for_pending_payment(self, mock_create):
+        payment = Payment.objects.create(
+            type=Payment.TransactionType.PAYMENT,
+            borrowing=self.borrowing_1,
+            money_to_pay=10,
+        )
+        mock_create.return_value = session_sample(
+            "cs_test_new", url="https://checkout.stripe.com/new"
+        )
+
+        url = create_checkout_session_task(
+            payment.id, "https://example.com/success", "https://example.com"
+        )
+        payment.refresh_from_db()
+
+        self.assertEqual(url, "https://checkout.stripe.com/new")
+        self.assertEqual(payment.session_id, "cs_test_new")
+        self.assertEqual(payment.session_url, url)
+        self.assertEqual(
+            mock_create.call_args.kwargs["line_items"][0]["price_data"][
+                "unit_amount"
+            ],
+            1000,
+        )
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_task_skips_payment_with_session(self, mock_create):
+        url = create_checkout_session_task(
+            self.payment_1.id, "https://example.com/success", "https://example.com"
+        )
+
+        self.assertEqual(url, self.payment_1.session_url)
+        mock_create.assert_not_called()
+
+    @patch("payments.services.stripe.checkout.Session.create")
+    def test_batch_task_opens_one_session_for_all_payments(
+        self, mock_create
+    ):
+        payments = [
+            Payment.objects.create(
+                type=Payment.TransactionType.PAYMENT,
+                borrowing=borrowing,
+                money_to_pay=10,
+            )
+            for borrowing in (self.borrowing_1, self.borrowing_2)
+        ]
+        mock_create.return_value = session_sample("cs_test_batch")
+
+        create_batch_checkout_session_task(
+            [payment.id for payment in payments],
+            "https://example.com/success",
+            "https://example.com",
+        )
+
+        mock_create.assert_called_once()
+        self.assertEqual(len(mock_create.call_args.kwargs["line_items"]), 2)
+        self.assertEqual(
+            Payment.objects.filter(session_id="cs_test_batch").count(), 2
+        )
+
+
+@patch("payments.services.stripe.checkout.Session")
+class SessionReuseTests(PaymentsAPITestCase):
+    def setUp(self):
+        Borrowing.objects.filter(id=self.borrowing_1.id).update(
+            borrowing_date=datetime.date.today() - datetime.timedelta(days=5),
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=2)
+            ),
+        )
+        self.borrowing_1.refresh_from_db()
+
+    def get_or_create_fine(self):
+        return get_or_create_checkout_session(
+            self.borrowing_1,
+            Payment.TransactionType.FINE,
+            "https://example.com/success",
+            "https://example.com",
+        )
+
+    def fine_sample(self, **params):
+        defaults = {
+            "type": Payment.TransactionType.FINE,
+            "borrowing": self.borrowing_1,
+            "session_url": "https://checkout.stripe.com/cs_test_open",
+            "session_id": "cs_test_open",
+            "session_expires_at": timezone.now()
+            + datetime.timedelta(hours=12),
+            "money_to_pay": 2,
+        }
+        defaults.update(params)
+        return Payment.objects.create(**defaults)
+
+    def test_new_fine_opens_session(self, mock_session):
+        mock_session.create.return_value = session_sample("cs_test_new")
+
+        payment, created = self.get_or_create_fine()
+
+        self.assertTrue(created)
+        self.assertEqual(payment.money_to_pay, 2)
+        self.assertEqual(payment.session_id, "cs_test_new")
+        self.assertIsNotNone(payment.session_expires_at)
+
+    def test_open_session_reused(self, mock_session):
+        fine = self.fine_sample()
+
+        payment, created = self.get_or_create_fine()
+
+        self.assertFalse(created)
+        self.assertEqual(payment, fine)
+        self.assertEqual(payment.session_url, fine.session_url)
+        mock_session.create.assert_not_called()
+        mock_session.expire.assert_not_called()
+
+    def test_session_with_outdated_amount_replaced(self, mock_session):
+        fine = self.fine_sample(money_to_pay=1)
+        mock_session.expire.return_value = session_sample(
+            fine.session_id, status="expired"
+        )
+        mock_session.create.return_value = session_sample("cs_test_new")
+
+        payment, created = self.get_or_create_fine()
+
+        self.assertFalse(created)
+        self.assertEqual(payment.id, fine.id)
+        self.assertEqual(payment.money_to_pay, 2)
+        self.assertEqual(payment.session_id, "cs_test_new")
+        mock_session.expire.assert_called_once_with("cs_test_open")
+
+    def test_expired_session_replaced(self, mock_session):
+        fine = self.fine_sample(
+            session_expires_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        mock_session.expire.side_effect = stripe.error.InvalidRequestError(
+            "Only open sessions can be expired", None
+        )
+        mock_session.retrieve.return_value = session_sample(
+            fine.session_id, status="expired"
+        )
+        mock_session.create.return_value = session_sample("cs_test_new")
+
+        payment, created = self.get_or_create_fine()
+        fine.refresh_from_db()
+
+        self.assertFalse(created)
+        self.assertEqual(fine.session_id, "cs_test_new")
+        self.assertEqual(Payment.objects.filter(type="FINE").count(), 1)
+
+    def test_older_pending_payments_expired(self, mock_session):
+        old_fine = self.fine_sample(session_id="cs_test_old")
+        fine = self.fine_sample()
+        mock_session.expire.return_value = session_sample(
+            old_fine.session_id, status="expired"
+        )
+
+        payment, _ = self.get_or_create_fine()
+        old_fine.refresh_from_db()
+
+        self.assertEqual(payment, fine)
+        self.assertEqual(old_fine.status, Payment.PaymentStatus.EXPIRED)
+        mock_session.expire.assert_called_once_with("cs_test_old")
+
+    def test_session_paid_meanwhile_not_replaced(self, mock_session):
+        fine = self.fine_sample(money_to_pay=1)
+        mock_session.expire.side_effect = stripe.error.InvalidRequestError(
+            "Only open sessions can be expired", None
+        )
+        mock_session.retrieve.return_value = session_sample(
+            fine.session_id, status="complete"
+        )
+
+        payment, created = self.get_or_create_fine()
+
+        self.assertFalse(created)
+        self.assertEqual(payment.session_id, "cs_test_open")
+        mock_session.create.assert_not_called()
+
+    def test_stripe_called_outside_transaction(self, mock_session):
+        fine = self.fine_sample(money_to_pay=1)
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def record_depth(session):
+            depths.append(len(connection.atomic_blocks))
+            return session
+
+        mock_session.expire.side_effect = lambda session_id: record_depth(
+            session_sample(session_id, status="expired")
+        )
+        mock_session.create.side_effect = lambda **kwargs: record_depth(
+            session_sample("cs_test_new")
+        )
+
+        self.get_or_create_fine()
+        fine.refresh_from_db()
+
+        self.assertEqual(depths, [depth, depth])
+        self.assertEqual(fine.session_id, "cs_test_new")
+        self.assertIsNone(fine.session_claimed_at)
+
+    def test_claimed_payment_not_replaced_again(self, mock_session):
+        fine = self.fine_sample(
+            money_to_pay=1,
+            session_url="",
+            session_claimed_at=timezone.now(),
+        )
+
+        payment, created = self.get_or_create_fine()
+
+        self.assertFalse(created)
+        self.assertEqual(payment, fine)
+        mock_session.expire.assert_not_called()
+        mock_session.create.assert_not_called()
+
+    def test_stale_claim_taken_over(self, mock_session):
+        fine = self.fine_sample(
+            money_to_pay=1,
+            session_claimed_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        mock_session.expire.return_value = session_sample(
+            fine.session_id, status="expired"
+        )
+        mock_session.create.return_value = session_sample("cs_test_new")
+
+        payment, _ = self.get_or_create_fine()
+
+        self.assertEqual(payment.session_id, "cs_test_new")
+
+    def test_failed_session_releases_claim(self, mock_session):
+        fine = self.fine_sample(money_to_pay=1)
+        mock_session.expire.return_value = session_sample(
+            fine.session_id, status="expired"
+        )
+        mock_session.create.side_effect = stripe.error.APIConnectionError(
+            "Network error"
+        )
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            self.get_or_create_fine()
+        fine.refresh_from_db()
+
+        self.assertIsNone(fine.session_claimed_at)
+        self.assertEqual(
+            fine.session_url, "https://checkout.stripe.com/cs_test_open"
+        )
+
+    def test_failed_session_bumps_borrowing_version(self, mock_session):
+        fine = self.fine_sample(money_to_pay=1)
+        mock_session.expire.return_value = session_sample(
+            fine.session_id, status="expired"
+        )
+        versions = []
+
+        def fail(**kwargs):
+            versions.append(
+                Borrowing.objects.get(id=self.borrowing_1.id).version
+            )
+            raise stripe.error.APIConnectionError("Network error")
+
+        mock_session.create.side_effect = fail
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            self.get_or_create_fine()
+        self.borrowing_1.refresh_from_db()
+
+        # An ETag taken while the session was replaced is not reused
+        self.assertGreater(self.borrowing_1.version, versions[0])
+
+    def test_failed_new_session_removes_payment(self, mock_session):
+        mock_session.create.side_effect = stripe.error.APIConnectionError(
+            "Network error"
+        )
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            self.get_or_create_fine()
+
+        self.assertFalse(Payment.objects.filter(type="FINE").exists())
+
+
+class ReconcilePendingPaymentsTests(PaymentsAPITestCase):
+    def payment_sample(self, session_id, **params):
+        defaults = {
+            "type": Payment.TransactionType.PAYMENT,
+            "borrowing": self.borrowing_1,
+            "session_url": f"https://checkout.stripe.com/{session_id}",
+            "session_id": session_id,
+            "session_expires_at": timezone.now()
+            + datetime.timedelta(hours=12),
+            "money_to_pay": 10,
+        }
+        defaults.update(params)
+        return Payment.objects.create(**defaults)
+
+    def reconcile(self, sessions, page_size=100):
+        created = int(time.time()) - 60 * 60
+        stub = StripeSessionStub(
+            [{"created": created, **session} for session in sessions],
+            page_size=page_size,
+        )
+        with patch("payments.services.stripe.checkout.Session", stub):
+            counts = reconcile_pending_payments()
+        return counts, stub
+
+    def test_statuses_resolved_from_session_lists(self):
+        paid = self.payment_sample("cs_paid")
+        expired = self.payment_sample("cs_expired")
+        still_open = self.payment_sample("cs_open")
+        processing = self.payment_sample("cs_processing")
+
+        counts, stub = self.reconcile(
+            [
+                {"id": "cs_paid", "status": "complete",
+                 "payment_status": "paid"},
+                {"id": "cs_expired", "status": "expired",
+                 "payment_status": "unpaid"},
+                {"id": "cs_open", "status": "open",
+                 "payment_status": "unpaid"},
+                {"id": "cs_processing", "status": "complete",
+                 "payment_status": "unpaid"},
+            ]
+        )
+        for payment in (paid, expired, still_open, processing):
+            payment.refresh_from_db()
+
+        self.assertEqual(counts, {"paid": 1, "expired": 1})
+        self.assertEqual(paid.status, Payment.PaymentStatus.PAID)
+        self.assertEqual(expired.status, Payment.PaymentStatus.EXPIRED)
+        self.assertEqual(still_open.status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(processing.status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(stub.requests, 2)
+
+    def test_paid_fine_returns_borrowing(self):
+        self.payment_sample("cs_fine", type=Payment.TransactionType.FINE)
+
+        self.reconcile(
+            [{"id": "cs_fine", "status": "complete", "payment_status": "paid"}]
+        )
+        self.borrowing_1.refresh_from_db()
+
+        self.assertEqual(
+            self.borrowing_1.actual_return_date, datetime.date.today()
+        )
+
+    def test_sessions_without_expiry_retrieved(self):
+        Payment.objects.exclude(session_id="").delete()
+        legacy = self.payment_sample("cs_legacy", session_expires_at=None)
+        recent = self.payment_sample("cs_recent")
+
+        counts, stub = self.reconcile(
+            [
+                {"id": "cs_legacy", "status": "complete",
+                 "payment_status": "paid",
+                 "created": int(time.time()) - 7 * 24 * 60 * 60},
+                {"id": "cs_recent", "status": "expired",
+                 "payment_status": "unpaid"},
+            ]
+        )
+        legacy.refresh_from_db()
+        recent.refresh_from_db()
+
+        self.assertEqual(counts, {"paid": 1, "expired": 1})
+        self.assertEqual(legacy.status, Payment.PaymentStatus.PAID)
+        self.assertEqual(recent.status, Payment.PaymentStatus.EXPIRED)
+        self.assertEqual(stub.retrievals, ["cs_legacy"])
+
+    def test_only_sessions_without_expiry_pending(self):
+        Payment.objects.exclude(session_id="").delete()
+        legacy = self.payment_sample("cs_legacy", session_expires_at=None)
+
+        counts, stub = self.reconcile(
+            [{"id": "cs_legacy", "status": "expired",
+              "payment_status": "unpaid"}]
+        )
+        legacy.refresh_from_db()
+
+        self.assertEqual(counts, {"paid": 0, "expired": 1})
+        self.assertEqual(legacy.status, Payment.PaymentStatus.EXPIRED)
+        self.assertEqual(stub.requests, 0)
+
+    @patch("payments.services.RECONCILIATION_CHUNK_SIZE", 2)
+    def test_pending_payments_processed_in_chunks(self):
+        payments = [self.payment_sample(f"cs_paid_{i}") for i in range(5)]
+
+        counts, stub = self.reconcile(
+            [
+                {"id": payment.session_id, "status": "complete",
+                 "payment_status": "paid"}
+                for payment in payments
+            ],
+            page_size=2,
+        )
+
+        self.assertEqual(counts["paid"], 5)
+        self.assertEqual(stub.requests, 4)
+
+    def test_nothing_to_reconcile(self):
+        Payment.objects.update(status=Payment.PaymentStatus.PAID)
+
+        counts, stub = self.reconcile([])
+
+        self.assertEqual(counts, {"paid": 0, "expired": 0})
+        self.assertEqual(stub.requests, 0)
+
+
+def webhook_event_sample(event_id, session_id, event_type=None, **session):
+    session.setdefault("payment_status", "paid")
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type or "checkout.session.completed",
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                **session,
+            }
+        },
+    }
+
+
+def sign_payload(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(),
+        f"{timestamp}.{payload}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(PaymentsAPITestCase):
+    def post_event(self, event, secret=WEBHOOK_SECRET):
+        payload = json.dumps(event)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                WEBHOOK_URL,
+                data=payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=sign_payload(payload, secret),
+            )
+
+    @patch("payments.views.async_task")
+    def test_completed_session_enqueued(self, mock_async_task):
+        event = webhook_event_sample("evt_1", self.payment_1.session_id)
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_async_task.assert_called_once_with(
+            "payments.services.complete_checkout_session",
+            self.payment_1.session_id,
+        )
+
+    @patch("payments.views.async_task")
+    def test_completed_session_enqueued_after_commit(self, mock_async_task):
+        event = webhook_event_sample("evt_1", self.payment_1.session_id)
+        payload = json.dumps(event)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                WEBHOOK_URL,
+                data=payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=sign_payload(payload),
+            )
+
+            mock_async_task.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+
+    @patch("payments.views.async_task")
+    def test_duplicate_event_processed_once(self, mock_async_task):
+        event = webhook_event_sample("evt_1", self.payment_1.session_id)
+        self.post_event(event)
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["message"], "Event already received")
+        mock_async_task.assert_called_once()
+
+    @patch("payments.views.async_task")
+    def test_unpaid_session_ignored(self, mock_async_task):
+        event = webhook_event_sample(
+            "evt_1", self.payment_1.session_id, payment_status="unpaid"
+        )
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_async_task.assert_not_called()
+
+    @patch("payments.views.async_task")
+    def test_invalid_signature_rejected(self, mock_async_task):
+        event = webhook_event_sample("evt_1", self.payment_1.session_id)
+        response = self.post_event(event, secret="whsec_wrong")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_async_task.assert_not_called()
+
+
+class CompleteCheckoutSessionTests(PaymentsAPITestCase):
+    def test_payment_marked_paid(self):
+        complete_checkout_session(self.payment_1.session_id)
+        self.payment_1.refresh_from_db()
+
+        self.assertEqual(self.payment_1.status, Payment.PaymentStatus.PAID)
+
+    def test_paid_fine_returns_borrowing(self):
+        fine = Payment.objects.create(
+            type=Payment.TransactionType.FINE,
+            borrowing=self.borrowing_1,
+            session_url="https://example.com",
+            session_id="session_id_fine",
+            money_to_pay=10,
+        )
+
+        complete_checkout_session(fine.session_id)
+        self.borrowing_1.refresh_from_db()
+
+        self.assertEqual(
+            self.borrowing_1.actual_return_date, datetime.date.today()
+        )
+
+
+class PaymentSessionConstraintTests(PaymentsAPITestCase):
+    def test_session_shared_by_multi_book_checkout(self):
+        Payment.objects.create(
+            type=Payment.TransactionType.PAYMENT,
+            borrowing=self.borrowing_2,
+            session_url="https://example.com",
+            session_id=self.payment_1.session_id,
+            money_to_pay=10,
+        )
+
+        complete_checkout_session(self.payment_1.session_id)
+
+        self.assertEqual(
+            Payment.objects.filter(
+                session_id=self.payment_1.session_id,
+                status=Payment.PaymentStatus.PAID,
+            ).count(),
+            2,
+        )
+
+    def test_session_borrowing_pair_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Payment.objects.create(
+                type=Payment.TransactionType.PAYMENT,
+                borrowing=self.borrowing_1,
+                session_url="https://example.com",
+                session_id=self.payment_1.session_id,
+                money_to_pay=10,
+            )
+
+    def test_pending_payments_without_session_allowed(self):
+        for _ in range(2):
+            Payment.objects.create(
+                type=Payment.TransactionType.PAYMENT,
+                borrowing=self.borrowing_1,
+                money_to_pay=10,
+            )
+
+        self.assertEqual(
+            Payment.objects.filter(session_id="").count(), 2
+        )
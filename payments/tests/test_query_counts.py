@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from borrowings.tests.test_query_counts import seed_borrowings
+
+PAYMENT_URL = reverse("payments:payment-list")
+
+LIST_QUERY_BUDGET = 1
+DETAIL_QUERY_BUDGET = 2
+
+
+def get_detail_url(payment_id):
+    return reverse("payments:payment-detail", args=[payment_id])
+
+
+class PaymentQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = get_user_model().objects.create(
+            email="user@test.com", password="1qazcde3"
+        )
+        cls.test_admin = get_user_model().objects.create(
+            email="admin@test.com", password="1qazcde3", is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.test_user)
+
+    def test_list_query_count_independent_of_size(self):
+        for count in (2, 20):
+            seed_borrowings(self.test_user, count)
+            with self.assertNumQueries(LIST_QUERY_BUDGET):
+                self.client.get(PAYMENT_URL)
+
+    def test_admin_list_query_count_independent_of_size(self):
+        self.client.force_authenticate(user=self.test_admin)
+        for count in (2, 20):
+            seed_borrowings(self.test_user, count)
+            with self.assertNumQueries(LIST_QUERY_BUDGET):
+                self.client.get(PAYMENT_URL)
+
+    def test_detail_query_count(self):
+        borrowing = seed_borrowings(self.test_user, 1)[0]
+        payment = borrowing.payments.first()
+
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            self.client.get(get_detail_url(payment.id))
@@ -1,18 +1,35 @@
 import stripe
+from django.conf import settings
+from django.db import transaction
+from django_q.tasks import async_task
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, status
 from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from payments.models import Payment
+from library_service.fieldsets import (
+    SPARSE_FIELDSET_PARAMETERS,
+    SparseFieldsetViewMixin,
+)
+from payments.fines import get_outstanding_fines
+from payments.models import Payment, StripeEvent
 from payments.serializers import (
     PaymentSerializer,
     PaymentListSerializer,
     PaymentDetailSerializer,
 )
 
+PAID_SESSION_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
+
 
 class PaymentsViewSet(
+    SparseFieldsetViewMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
     GenericViewSet,
@@ -22,8 +39,20 @@ class PaymentsViewSet(
 
     def get_queryset(self):
         user = self.request.user
-        queryset = self.queryset
+        queryset = self.queryset.all()
+        nests_borrowing = self.action == "retrieve" or (
+            self.action == "list" and "borrowing" in self.requested_expand
+        )
+        if nests_borrowing and self.shows_field("borrowing"):
+            queryset = queryset.select_related(
+                "borrowing__book"
+            ).prefetch_related("borrowing__payments")
         if self.action in ["retrieve", "list"]:
+            if self.requested_fields is not None:
+                columns = self.requested_fields & {
+                    field.name for field in Payment._meta.concrete_fields
+                }
+                queryset = queryset.only("id", *columns)
             if user.is_staff:
                 return queryset
             return queryset.filter(borrowing__user__id=user.id)
@@ -36,6 +65,16 @@ class PaymentsViewSet(
             return PaymentDetailSerializer
         return PaymentSerializer
 
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        """Get list of payments"""
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        """Get payment detail"""
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=["GET"], url_path="success")
     def success(self, request):
         """Endpoint for successful payments"""
@@ -47,28 +86,56 @@ class PaymentsViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        session = stripe.checkout.Session.retrieve(session_id)
-        transaction_type = session["metadata"]["transaction_type"]
+        statuses = set(
+            Payment.objects.filter(session_id=session_id).values_list(
+                "status", flat=True
+            )
+        )
+        if not statuses:
+            return Response(
+                {"error": "Payment not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if statuses == {Payment.PaymentStatus.PAID}:
+            return Response(
+                {"message": "Payment successful"},
+                status=status.HTTP_200_OK,
+            )
+        return Response(
+            {"message": "Payment is being processed"},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        if session.payment_status == "paid":
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="user_id",
+                description="Balance of another user (staff only)",
+                type=OpenApiTypes.INT,
+                required=False,
+            ),
+        ]
+    )
+    @action(detail=False, methods=["GET"], url_path="balance")
+    def balance(self, request):
+        """Outstanding fines accrued by the user"""
+        user_id = request.user.id
+        if request.user.is_staff and request.query_params.get("user_id"):
             try:
-                payment = Payment.objects.get(session_id=session_id)
-                payment.status = Payment.PaymentStatus.PAID
-                payment.save()
-                if transaction_type == Payment.TransactionType.FINE:
-                    payment.borrowing.return_borrowing()
-                return Response(
-                    {"message": "Payment successful"},
-                    status=status.HTTP_200_OK,
-                )
-            except Payment.DoesNotExist:
+                user_id = int(request.query_params["user_id"])
+            except ValueError:
                 return Response(
-                    {"error": "Payment not found"},
-                    status=status.HTTP_404_NOT_FOUND,
+                    {"error": "user_id must be an integer"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
+
         return Response(
-            {"error": "Payment not completed"},
-            status=status.HTTP_400_BAD_REQUEST,
+            {
+                "user": user_id,
+                "outstanding": get_outstanding_fines(user_id),
+            },
+            status=status.HTTP_200_OK,
         )
 
     @action(detail=False, methods=["GET"], url_path="cancel")
@@ -78,3 +145,51 @@ class PaymentsViewSet(
             {"message": "Payment canceled. You can retry within 24h."},
             status=status.HTTP_200_OK,
         )
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="webhook",
+        permission_classes=(AllowAny,),
+        authentication_classes=(),
+    )
+    def webhook(self, request):
+        """Endpoint for signed Stripe webhook events"""
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.headers.get("Stripe-Signature", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response(
+                {"error": "Invalid payload or signature"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            _, created = StripeEvent.objects.get_or_create(
+                event_id=event.id, defaults={"type": event.type}
+            )
+            if not created:
+                return Response(
+                    {"message": "Event already received"},
+                    status=status.HTTP_200_OK,
+                )
+
+            session = event.data.object
+            if (
+                event.type in PAID_SESSION_EVENTS
+                and session.payment_status == "paid"
+            ):
+                transaction.on_commit(
+                    lambda: async_task(
+                        "payments.services.complete_checkout_session",
+                        session.id,
+                    )
+                )
+
+        return Response(
+            {"message": "Event received"},
+            status=status.HTTP_200_OK,
+        )